@@ -5,6 +5,7 @@ import pathlib
 from core import Config, Context, Patbot, errors
 from core.formatting import *
 from core import permissions as perms
+from core.response_cache import cached_response
 from cogs.cogmanager.utils import autoformat_cog
 
 
@@ -106,6 +107,7 @@ class CogManager(commands.Cog, name='Cog Manager'):
         self.bot.reload_cog(cog_name)
         await ctx.react_or_send(success, f'Successfully reloaded `{cog_name}`!')
 
+    @cached_response(ttl=300.0)
     @_cogs.command(name='info')
     async def _cogs_info(self, ctx: Context, *, cog_name: str):
         """Displays information about a given cog."""
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import discord
 from discord.ext import commands, menus
@@ -6,11 +7,16 @@ import os
 import pip
 import platform
 import sys
+import threading
 import time
 
 from core import Config, Context, menus, Patbot
 from core import formatting as fmt
 from core import permissions as perms
+from core import tracing
+from core.metrics import metrics
+from core.profiling import StackSampler
+from core.response_cache import cached_response
 
 
 class Core(commands.Cog):
@@ -20,6 +26,7 @@ class Core(commands.Cog):
         self.bot = bot
         self.config = Config.core_config()
         self._register_defaults()
+        self._sampler = None
 
     def _register_defaults(self):
         self.config.register_global(
@@ -33,6 +40,8 @@ class Core(commands.Cog):
             },
             accepts_embeds=True,
             embed_color=hex(discord.Color.blurple().value),
+            concurrency={},
+            scheduled={},
         )
         self.config.register_guild(
             prefixes=['!!'],
@@ -45,6 +54,7 @@ class Core(commands.Cog):
             },
             accepts_embeds=True,
             embed_color=hex(discord.Color.blurple().value),
+            concurrency={},
         )
 
     @perms.owner()
@@ -66,6 +76,81 @@ class Core(commands.Cog):
         if isinstance(err, commands.BadBoolArgument):
             return await ctx.invoke(self._shutdown)
 
+    @perms.owner()
+    @commands.command(name='metrics', hidden=True)
+    async def _metrics(self, ctx: Context, prefix: str = ''):
+        """Shows Patbot's internal metrics, optionally only those starting with a prefix.
+        Permissions: Bot owner only.
+        """
+        content = metrics.export(prefix)
+        if not content:
+            return await ctx.send(fmt.info, 'No metrics have been recorded yet.')
+        if len(content) > 1900:
+            return await ctx.send(file=fmt.text_to_file(content, 'metrics.txt'))
+        await ctx.send(content=fmt.block(content, lang=''))
+
+    @perms.owner()
+    @commands.command(name='profile', hidden=True)
+    async def _profile(self, ctx: Context, seconds: float = 30.0, rate: float = 100.0):
+        """Samples what Patbot is doing for a while and sends the result as a flamegraph-ready file.
+        Permissions: Bot owner only.
+
+        The event loop's stack is sampled `rate` times per second for `seconds` seconds
+        (at most 10 minutes). The file uses the collapsed stack format, so it can be fed
+        straight into flamegraph.pl, speedscope, or similar tools.
+        """
+        if self._sampler is not None and self._sampler.running:
+            return await ctx.send(fmt.error, 'A profile is already being recorded.')
+        seconds = min(max(seconds, 1.0), 600.0)
+        rate = min(max(rate, 1.0), 1000.0)
+        sampler = self._sampler = StackSampler(threading.get_ident(), rate=rate)
+        await ctx.send(fmt.info, f'Profiling for {fmt.format_time(int(seconds))} at {rate:g} samples per second...')
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await self.bot.loop.run_in_executor(None, sampler.stop)
+        if not sampler.samples:
+            return await ctx.send(fmt.warning, 'No samples were recorded.')
+        top = '\n'.join(f'{count:>6}  {label}' for label, count in sampler.top())
+        await ctx.send(content=f'**{sampler.samples}** samples. Busiest functions:\n' + fmt.block(top, lang=''),
+                       file=fmt.text_to_file(sampler.collapsed(), 'profile.folded'))
+
+    @perms.owner()
+    @commands.command(name='traces', hidden=True)
+    async def _traces(self, ctx: Context, count: int = 20):
+        """Sends the most recent command traces as a Chrome trace file.
+        Permissions: Bot owner only.
+
+        Open the file in chrome://tracing, Perfetto, or speedscope to see where each
+        command spent its time.
+        """
+        traces = tracing.tracer.recent(max(1, count))
+        if not traces:
+            return await ctx.send(fmt.info, 'No commands have been traced yet.')
+        slowest = sorted(traces, key=lambda t: -t.duration)[:5]
+        summary = '\n'.join(f'{t.duration * 1000:>8.1f}ms  {t.name}' for t in slowest)
+        await ctx.send(content=f'**{len(traces)}** traces. Slowest:\n' + fmt.block(summary, lang=''),
+                       file=fmt.text_to_file(tracing.tracer.to_chrome(traces), 'traces.json'))
+
+    @perms.owner()
+    @commands.command(name='ratelimits', hidden=True)
+    async def _ratelimits(self, ctx: Context):
+        """Shows how hard Patbot is hitting Discord's API and how often it gets rate limited.
+        Permissions: Bot owner only.
+        """
+        telemetry = self.bot.http_telemetry
+        busiest = '\n'.join(f'{s.per_minute():>5}/min {s.requests:>7} total {s.mean_latency * 1000:>7.1f}ms  {s.bucket}'
+                            for s in telemetry.busiest())
+        limited = '\n'.join(f'{s.rate_limited:>5}x 429 {s.retry_after:>8.2f}s waited  {s.bucket}'
+                            for s in telemetry.rate_limited())
+        content = f'**Busiest buckets**\n{fmt.block(busiest or "No requests yet.", lang="")}' \
+                  f'**Rate limited buckets** (global: {telemetry.global_rate_limited})\n' \
+                  f'{fmt.block(limited or "None.", lang="")}'
+        if len(content) > 2000:
+            return await ctx.send(file=fmt.text_to_file(f'{busiest}\n\n{limited}', 'ratelimits.txt'))
+        await ctx.send(content=content)
+
     @commands.command(name='ping')
     async def _ping(self, ctx: Context):
         """Pong!"""
@@ -90,6 +175,7 @@ class Core(commands.Cog):
     #     else:
     #         return await ctx.react_or_send(fmt.error, "This command can't be used here.")
 
+    @cached_response(ttl=60.0)
     @commands.command(name='about', aliases=['info'])
     async def _about(self, ctx: Context):
         """About Patbot."""
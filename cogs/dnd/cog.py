@@ -1,21 +1,38 @@
+import asyncio
 import d20
 import discord
 from discord.ext import commands
+import logging
+from pathlib import Path
 import random
 import string
+from typing import Optional
 
 from core import Config, Context, Patbot
-from core.formatting import success, error
+from core import concurrency
+from core import permissions as perms
+from core.response_cache import cached_response
+from core.formatting import block, success, error
 from core.menus import Confirm, SingleChoice
 from .lib.genesys.lookup import *
-from .lib.dnd import Cache
+from .lib.dnd import Cache, LRUMemo
+from .lib.dnd.bundle import Bundle, build_bundle
 from .lib.dnd.display.spells import spell_info
 from .lib.dnd.display.conditions import condition_info
 from .lib.dnd.display.items import item_info, item_info2
 
+log = logging.getLogger('dnd')
 
+
+@concurrency.limit(6, queue=12)
 class DnD(commands.Cog):
     """Allows dice rolling among other D&D utilities."""
+    # How often the loading message shows how far along the cache is, in seconds.
+    PROGRESS_INTERVAL = 2.0
+    # Bounds of the memo of rendered spells, conditions and items; sizes are in characters.
+    RENDERED_ENTRIES = 512
+    RENDERED_BYTES = 4 * 2 ** 20
+    BUNDLE_PATH = Path('cogs', 'dnd', 'cache', 'bundle.json.gz')
 
     def __init__(self, bot: Patbot):
         self.bot = bot
@@ -23,11 +40,68 @@ class DnD(commands.Cog):
         self._register_defaults()
         self._d20 = '<:d20:734505366821404693>'
         self.banned_names = ('adv', 'a', 'dis', 'disadv', 'd', 'stats')
-        self.cache = Cache()
-        self._gathered = dict()
+        self.cache = Cache(cache_dir=Path('cogs', 'dnd', 'cache'))
+        self.cache.add_reload_listener(self._data_reloaded)
+        # Rendered entries keyed by (kind, name, 'embed' or 'message').
+        self._rendered = LRUMemo(max_entries=self.RENDERED_ENTRIES, max_bytes=self.RENDERED_BYTES,
+                                 sizeof=lambda rendered: rendered.size)
+        # Every entry rendered ahead of time; None while there is none that matches the data.
+        self._bundle: Optional[Bundle] = None
+        self._bundling: Optional[asyncio.Task] = None
+        self.bot.loop.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        engine = await self.config.search_engine()
+        try:
+            self.cache.engine = engine
+        except ValueError as e:
+            log.warning(f'{e} Using the {self.cache.engine} search engine.')
+        try:
+            await self.cache.warm_up()
+        except Exception:
+            return  # Logged by the cache; entries are rendered on lookup instead.
+        self._update_bundle()
+
+    def cog_unload(self):
+        self.cache.close()
+        if self._bundling is not None:
+            self._bundling.cancel()
+
+    def _data_reloaded(self):
+        self._rendered.clear()
+        self._bundle = None
+        self._update_bundle()
+
+    def _update_bundle(self):
+        if self._bundling is not None:
+            self._bundling.cancel()
+        self._bundling = self.bot.loop.create_task(self._load_bundle())
+
+    async def _load_bundle(self):
+        """Uses the saved bundle if it was rendered from the current data, and renders a new one otherwise.
+        Until it is done, entries are rendered when they are looked up.
+        """
+        loop = asyncio.get_running_loop()
+        data = self.cache.data
+        try:
+            fingerprint = await loop.run_in_executor(None, self.cache.fingerprint)
+            bundle = await loop.run_in_executor(None, Bundle.load, self.BUNDLE_PATH)
+            if bundle is None or not bundle.matches(fingerprint):
+                log.info('The D&D bundle is missing or out of date; rendering a new one.')
+                bundle = await loop.run_in_executor(None, self._build_bundle, data, fingerprint)
+        except Exception:
+            log.exception('Could not load or build the D&D bundle.')
+            return
+        if self.cache.data is data:
+            self._bundle = bundle
+
+    def _build_bundle(self, data: dict, fingerprint: str) -> Bundle:
+        bundle = build_bundle(data, fingerprint)
+        bundle.save(self.BUNDLE_PATH)
+        return bundle
 
     def _register_defaults(self):
-        self.config.register_global(macros={})
+        self.config.register_global(macros={}, search_engine='trigram')
         self.config.register_guild(macros={})
 
     async def _replace_macros(self, ctx: Context, expr: str):
@@ -80,6 +154,7 @@ class DnD(commands.Cog):
             content += f'\n**Triumphs/Despairs**:  {td}'
             await ctx.send(content=content)
 
+    @concurrency.limit(4, queue=8)
     @commands.group('roll', aliases=['r'], invoke_without_command=True)
     async def _roll(self, ctx: Context, *, expr: str = '1d20'):
         """Rolls dice!
@@ -176,6 +251,7 @@ class DnD(commands.Cog):
             del macros[old_name]
         await ctx.send(success, f'The macro `{old_name}` has been renamed to `{new_name}`.')
 
+    @cached_response()
     @_macro.command('list')
     async def _macro_list(self, ctx: Context):
         """Lists all macros available in the current scope."""
@@ -245,12 +321,26 @@ class DnD(commands.Cog):
     async def _send_cache_loading(self, ctx: Context):
         if self.cache.initialized:
             return None
-        if await ctx.accepts_embeds():
-            embed = await ctx.default_embed(title=self._d20 + ' Loading cache... this might take a few seconds...')
-            message = await ctx.send(embed=embed)
+        title = self._d20 + ' Loading cache... this might take a few seconds...'
+        use_embed = await ctx.accepts_embeds()
+        if use_embed:
+            message = await ctx.send(embed=await ctx.default_embed(title=title))
         else:
             message = await ctx.send(self._d20, 'Loading cache... this might take a few seconds...')
-        await self.cache.initialize(ignore_ua=True)
+        # Usually the warm-up started with the cog is already under way; this waits for it.
+        loading = asyncio.ensure_future(self.cache.initialize(ignore_ua=True))
+        try:
+            while not loading.done():
+                await asyncio.wait((loading,), timeout=self.PROGRESS_INTERVAL)
+                done, total = self.cache.progress
+                if not loading.done() and total:
+                    if use_embed:
+                        await message.edit(embed=await ctx.default_embed(title=f'{title} ({done}/{total} files)'))
+                    else:
+                        await message.edit(content=f'{self._d20} Loading cache... ({done}/{total} files)')
+            loading.result()
+        finally:
+            loading.cancel()
         return message
 
     async def _send_choice(self, ctx: Context, choices: list, content: str, message: discord.Message):
@@ -276,6 +366,20 @@ class DnD(commands.Cog):
             result = choices[0]
         return result, message
 
+    async def _send_info(self, ctx: Context, kind: str, name: str, info_type: type, message: discord.Message):
+        embed = await ctx.accepts_embeds()
+
+        async def render():
+            if self._bundle is not None:
+                rendered = self._bundle.get(kind, name, embed)
+                if rendered is not None:
+                    return rendered
+            return await info_type(getattr(self.cache, f'get_{kind}')(name)).render(ctx, embed=embed)
+
+        rendered = await self._rendered.get_or_create((kind, name, 'embed' if embed else 'message'), render)
+        return await rendered.send(ctx, message)
+
+    @concurrency.limit(2, queue=6)
     @commands.command(name='spell', aliases=['spells'])
     async def _spell(self, ctx: Context, *, spell_name: str):
         """Displays a D&D spell's entry.
@@ -288,13 +392,9 @@ class DnD(commands.Cog):
         if result is None:
             return
 
-        gathered = self._gathered.setdefault('spell', dict())
-        spell = gathered.setdefault(result, spell_info(self.cache.get_spell(result)))
-        if await ctx.accepts_embeds():
-            return await spell.send_as_embed(ctx, message)
-        else:
-            return await spell.send_as_message(ctx, message)
+        return await self._send_info(ctx, 'spell', result, spell_info, message)
 
+    @concurrency.limit(2, queue=6)
     @commands.command(name='condition', aliases=['conditions', 'cond'])
     async def _condition(self, ctx: Context, *, condition_name: str):
         """Displays a D&D condition's entry."""
@@ -302,13 +402,9 @@ class DnD(commands.Cog):
         if result is None:
             return
 
-        gathered = self._gathered.setdefault('condition', dict())
-        condition = gathered.setdefault(result, condition_info(self.cache.get_condition(result)))
-        if await ctx.accepts_embeds():
-            return await condition.send_as_embed(ctx, message)
-        else:
-            return await condition.send_as_message(ctx, message)
+        return await self._send_info(ctx, 'condition', result, condition_info, message)
 
+    @concurrency.limit(2, queue=6)
     @commands.command(name='item', aliases=['items'])
     async def _item(self, ctx: Context, *, item_name: str):
         """Displays a D&D item's entry."""
@@ -316,14 +412,35 @@ class DnD(commands.Cog):
         if result is None:
             return
 
-        gathered = self._gathered.setdefault('item', dict())
-        item = gathered.setdefault(result, item_info2(self.cache.get_item(result)))
-        if await ctx.accepts_embeds():
-            # return await item.send_as_embed(ctx, message)
-            return await item.send_as_embeds(ctx, message)
+        return await self._send_info(ctx, 'item', result, item_info2, message)
+
+    @perms.owner()
+    @commands.command(name='dndcache', hidden=True)
+    async def _dndcache(self, ctx: Context):
+        """Shows the state of the D&D data cache.
+        Permissions: Bot owner only.
+        """
+        cache = self.cache
+        done, total = cache.progress
+        if cache.initialized:
+            state = f'Loaded from {cache.loaded_from} in {cache.load_seconds:.2f}s'
+        elif cache.initializing:
+            state = 'Loading'
+        else:
+            state = 'Not loaded'
+        lines = [f'{state}; {done}/{total} files; {cache.engine} search' + ('; revalidating' if cache.revalidating else '')]
+        lookups = cache.lookups
+        lines.append(f'{sum(lookups.values())} lookups: {lookups["exact"]} exact, {lookups["alias"]} by alias, '
+                     f'{lookups["fuzzy"]} fuzzy ({cache.hit_rate:.0%} without fuzzy search)')
+        rendered = self._rendered
+        lines.append(f'{len(rendered)} rendered entries ({rendered.size} chars): {rendered.hits} hits, '
+                     f'{rendered.misses} misses, {rendered.evictions} evicted ({rendered.hit_rate:.0%} hit rate)')
+        if self._bundle is not None:
+            lines.append(f'Serving {len(self._bundle)} pre-rendered entries')
         else:
-            # return await item.send_as_message(ctx, message)
-            return await item.send_as_messages(ctx, message)
+            lines.append('Rendering on lookup' + (' while the bundle is built' if self._bundling and not self._bundling.done() else ''))
+        lines.extend(f'{seconds:>6.2f}s  {url}' for url, seconds in cache.slowest(5))
+        await ctx.send(content=block('\n'.join(lines), lang=''))
 
 
 def setup(bot):
@@ -1,2 +1,7 @@
-from .data import get_all_from_index, get_json
+from .data import Fetcher, get_all_from_index, get_json
 from .cache import Cache
+from .memo import LRUMemo
+from .names import AliasIndex, normalize
+from .pack import Pack, PackError, load_pack, write_pack
+from .search import BigramMatrixIndex, NameIndex, SEARCH_ENGINES, TrigramIndex
+from .store import EntryStore
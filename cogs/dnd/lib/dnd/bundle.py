@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from .cache import Cache
+from .display import Rendered
+from .display.conditions import condition_info
+from .display.items import item_info2
+from .display.spells import spell_info
+
+__all__ = [
+    'BUNDLE_VERSION',
+    'RENDERERS',
+    'Bundle',
+    'build_bundle',
+]
+
+log = logging.getLogger('dnd.bundle')
+
+# Bump this whenever the display code changes what it renders, so old bundles are rebuilt.
+BUNDLE_VERSION = 1
+
+RENDERERS = {
+    'spell': spell_info,
+    'condition': condition_info,
+    'item': item_info2,
+}
+
+# Per entry: message contents, embed title, embed descriptions.
+_Entry = Tuple[List[str], str, List[str]]
+
+
+class Bundle:
+    """Every spell, condition and item rendered ahead of time, for both messages and embeds.
+
+    A bundle belongs to the data it was rendered from, identified by :meth:`Cache.fingerprint`;
+    it is saved as gzipped JSON.
+    """
+
+    def __init__(self, fingerprint: str, entries: Dict[str, Dict[str, _Entry]], version: int = BUNDLE_VERSION):
+        self.fingerprint = fingerprint
+        self.version = version
+        self.entries = entries
+
+    def __len__(self) -> int:
+        return sum(map(len, self.entries.values()))
+
+    def matches(self, fingerprint: str) -> bool:
+        return self.version == BUNDLE_VERSION and self.fingerprint == fingerprint
+
+    def get(self, kind: str, name: str, embed: bool) -> Optional[Rendered]:
+        entry = self.entries.get(kind, {}).get(name)
+        if entry is None:
+            return None
+        contents, title, sections = entry
+        return Rendered(title, sections) if embed else Rendered(None, contents)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional['Bundle']:
+        """Reads a saved bundle. Returns None if there is none or it cannot be read. Blocks."""
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                data = json.load(file)
+            return cls(data['fingerprint'], data['entries'], data['version'])
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                log.warning(f'Could not read the bundle at {path}: {e!r}')
+            return None
+
+    def save(self, path: Union[str, Path]):
+        """Blocks."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        data = {'version': self.version, 'fingerprint': self.fingerprint, 'entries': self.entries}
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+
+def build_bundle(caches: Dict[str, Dict[str, dict]], fingerprint: str) -> Bundle:
+    """Renders every entry of `caches`. Entries that fail to render are left out.
+
+    Blocks for a few seconds, so run it in an executor; it uses an event loop of its own.
+    """
+    start = time.perf_counter()
+    loop = asyncio.new_event_loop()
+    try:
+        entries, failed = loop.run_until_complete(_render_all(caches))
+    finally:
+        loop.close()
+    bundle = Bundle(fingerprint, entries)
+    log.info(f'Rendered {len(bundle)} entries in {time.perf_counter() - start:.2f}s'
+             + (f'; {failed} could not be rendered.' if failed else '.'))
+    return bundle
+
+
+async def _render_all(caches: Dict[str, Dict[str, dict]]) -> Tuple[Dict[str, Dict[str, _Entry]], int]:
+    # Rendering does not depend on the context, so there is none.
+    entries = {}
+    failed = 0
+    for kind, info_type in RENDERERS.items():
+        rendered = entries[kind] = {}
+        for name, data in caches.get(kind, {}).items():
+            try:
+                message = await info_type(data).render(None, embed=False)
+                embed = await info_type(data).render(None, embed=True)
+            except Exception:
+                failed += 1
+                log.debug(f'Could not render {kind} {name!r}.', exc_info=True)
+                continue
+            rendered[name] = (message.sections, embed.title, embed.sections)
+    return entries, failed
+
+
+async def main(cache_dir: Path, output: Path, offline: bool):
+    cache = Cache(cache_dir=cache_dir, offline=offline)
+    await cache.initialize()
+    if cache.revalidating:
+        await cache._revalidating
+    cache.close()
+    # build_bundle runs an event loop of its own, so it cannot run on this one.
+    loop = asyncio.get_running_loop()
+    bundle = await loop.run_in_executor(None, build_bundle, cache.data, cache.fingerprint())
+    bundle.save(output)
+    print(f'Wrote {len(bundle)} entries to {output} ({output.stat().st_size / 2 ** 20:.1f} MiB).')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Renders the D&D data into a bundle the DnD cog serves lookups from.')
+    parser.add_argument('--cache-dir', type=Path, default=Path('cogs', 'dnd', 'cache'),
+                        help='where the downloaded 5e.tools files are kept')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='the bundle file to write (default: bundle.json.gz in the cache directory)')
+    parser.add_argument('--offline', action='store_true',
+                        help='if files were downloaded before, use them without checking for new ones')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.cache_dir, args.output or args.cache_dir / 'bundle.json.gz', args.offline))
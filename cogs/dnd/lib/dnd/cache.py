@@ -1,13 +1,67 @@
-from fuzzywuzzy import fuzz, process
-from typing import List, Optional
+import aiohttp
+import asyncio
+from collections import Counter
+import contextlib
+import hashlib
+import json
+from fuzzywuzzy import fuzz
+import logging
+from pathlib import Path
+import time
+from typing import Callable, Collection, Dict, List, Mapping, Optional, Tuple, Union
 
-from . import get_all_from_index, get_json
+from .data import DiskCache, Fetcher, NotCached, get_all_from_index, index_files
+from .names import AliasIndex
+from .pack import Pack, PackError, load_pack, write_pack
+from .search import NameIndex, SEARCH_ENGINES, TrigramIndex
+from .store import EntryStore
+
+log = logging.getLogger('dnd.cache')
 
 
 class Cache:
-    def __init__(self):
+    """The 5e.tools data, indexed by name.
+
+    With a `cache_dir`, the downloaded files are kept on disk. Initializing then loads them from
+    there without touching the network and revalidates them in the background, where every file
+    that has not changed costs a 304 and is not read again; if any did change, the categories they
+    belong to are rebuilt and swapped in. If
+    5e.tools cannot be reached, the copies on disk are used. If `offline`, the copies on disk are
+    used without revalidating them; 5e.tools is only asked for the files when there are none.
+
+    Queries are first looked up by exact name, then by normalized name or alias (see
+    :func:`normalize`); only if both miss do they go through the fuzzy search, using one of the
+    :data:`SEARCH_ENGINES`, chosen with `engine`. :attr:`lookups` counts how each query was resolved.
+
+    Entries are kept as JSON in an :class:`EntryStore` per category and parsed when they are
+    looked up; `parsed` of each stay parsed.
+
+    If `packed`, whenever the data is loaded from the files it is also written to a :class:`Pack`
+    in `cache_dir`. The next initialization maps that instead of parsing the files, as long as the
+    files have not changed since; otherwise, or if it cannot be read, the files are loaded as usual.
+
+    Only one load runs at a time: everything that calls :meth:`initialize` while one is in
+    progress waits for that one, and :meth:`warm_up` starts it in the background.
+    """
+
+    def __init__(self, *, concurrency: int = 8, cache_dir: Union[str, Path] = None, engine: str = 'trigram',
+                 parsed: int = 64, packed: bool = True, offline: bool = False):
         self._initialized = False
-        self._caches = {
+        self.offline = offline
+        self._engine = engine
+        self.parsed = parsed
+        self.concurrency = concurrency
+        self.disk = DiskCache(cache_dir) if cache_dir is not None else None
+        self.pack_path = self.disk.root / 'index.pack' if self.disk is not None and packed else None
+        self.timings: Dict[str, float] = {}
+        # How long the initial load took, and whether it came from 'pack', 'disk' or 'network'.
+        self.load_seconds: Optional[float] = None
+        self.loaded_from: Optional[str] = None
+        self._initializing: Optional[asyncio.Future] = None
+        self._fetcher: Optional[Fetcher] = None
+        self._revalidating: Optional[asyncio.Task] = None
+        self._reload_listeners: List[Callable[[], None]] = []
+        self._sources = {
             'spell':
                 'https://5e.tools/data/spells/index.json',
             'condition':
@@ -18,11 +72,63 @@ class Cache:
                 ('https://5e.tools/data/items-base.json', 'baseitem')
             ],
         }
+        self._caches: Dict[str, EntryStore] = {}
+        self._indexes: Dict[str, NameIndex] = {}
+        self._aliases: Dict[str, AliasIndex] = {}
+        self.lookups = Counter()
+        self._fingerprint: Optional[Tuple[dict, str]] = None
 
     @property
     def initialized(self):
         return self._initialized
 
+    @property
+    def data(self) -> Dict[str, Mapping[str, dict]]:
+        """Every entry by category, then by name. Replaced as a whole, never changed in place."""
+        return self._caches
+
+    def fingerprint(self) -> str:
+        """A hash of the data, to tell whether something derived from it is up to date. Takes a while."""
+        caches = self._caches
+        if self._fingerprint is None or self._fingerprint[0] is not caches:
+            digest = hashlib.sha1()
+            for name in sorted(caches):
+                store = caches[name]
+                digest.update(json.dumps([name, list(store)]).encode('utf-8'))
+                # Entry by entry, since the stores of a pack share the buffer of the whole file.
+                for key in store:
+                    start, end = store.span(key)
+                    digest.update(store.buffer[start:end])
+            self._fingerprint = (caches, digest.hexdigest())
+        return self._fingerprint[1]
+
+    @property
+    def engine(self) -> str:
+        return self._engine
+
+    @engine.setter
+    def engine(self, engine: str):
+        if engine not in SEARCH_ENGINES:
+            raise ValueError(f'Unknown search engine {engine!r}.')
+        if engine != self._engine:
+            self._engine = engine
+            self._indexes = self._build_indexes(self._caches)
+
+    @property
+    def initializing(self) -> bool:
+        return self._initializing is not None and not self._initializing.done()
+
+    @property
+    def revalidating(self) -> bool:
+        return self._revalidating is not None and not self._revalidating.done()
+
+    @property
+    def progress(self) -> Tuple[int, int]:
+        """``(files loaded, files asked for)`` by the current or last load. The total grows as indexes come in."""
+        if self._fetcher is None:
+            return 0, 0
+        return self._fetcher.completed, self._fetcher.requested
+
     def __getattr__(self, item):
         if item.endswith('_cache'):
             return self._caches[item[:-6]]
@@ -34,43 +140,243 @@ class Cache:
             else:
                 return lambda query: self._get(item[4:], query)
 
+    def _source_list(self) -> List[Tuple[str, str, str]]:
+        """Returns ``(url, key in the file, cache to add to)`` for every source."""
+        sources = []
+        for k, v in self._sources.items():
+            if isinstance(v, list):
+                sources.extend((url, item, k) for (url, item) in v)
+            else:
+                sources.append((v, k, k))
+        return sources
+
     async def initialize(self, ignore_ua: bool = True):
+        """Loads the data, or waits for the load already in progress. If it fails, the next call tries again."""
         if self._initialized:
             return
-        caches = dict()
-        for k, v in self._caches.items():
-            if isinstance(v, list):
-                for (url, item) in v:
-                    await self._add_json_to_cache(url, item, k, caches, ignore_ua=ignore_ua)
+        if self._initializing is None:
+            self._initializing = asyncio.ensure_future(self._initialize(ignore_ua))
+            self._initializing.add_done_callback(self._initialize_done)
+        # Shielded so that one caller being cancelled does not cancel the load for everyone else.
+        await asyncio.shield(self._initializing)
+
+    def warm_up(self, ignore_ua: bool = True) -> asyncio.Future:
+        """Starts initializing in the background."""
+        task = asyncio.ensure_future(self.initialize(ignore_ua))
+        task.add_done_callback(_log_failure)
+        return task
+
+    def _initialize_done(self, task: asyncio.Future):
+        if task.cancelled() or task.exception() is not None:
+            self._initializing = None
+
+    async def _initialize(self, ignore_ua: bool):
+        start = time.perf_counter()
+        if self.disk is not None:
+            pack = await self._load_pack(ignore_ua)
+            if pack is not None:
+                self._use_pack(pack)
+                self._loaded(start, 'pack')
             else:
-                await self._add_json_to_cache(v, k, k, caches, ignore_ua=ignore_ua)
+                try:
+                    caches, _ = await self._load(ignore_ua, offline=True)
+                except NotCached:
+                    pass
+                else:
+                    self._use(caches)
+                    self._loaded(start, 'disk')
+                    await self._save_pack(ignore_ua)
+            if self._initialized:
+                if not self.offline:
+                    self._revalidating = asyncio.ensure_future(self.revalidate(ignore_ua))
+                    self._revalidating.add_done_callback(_log_failure)
+                return
+        caches, fetcher = await self._load(ignore_ua)
+        self._use(caches)
+        self.timings = fetcher.timings
+        self._loaded(start, 'network')
+        log.info('Slowest files: ' + ', '.join(f'{url.rsplit("/", 1)[-1]} {seconds:.2f}s'
+                                              for url, seconds in self.slowest(5)))
+        await self._save_pack(ignore_ua)
+
+    def _use(self, caches: dict):
         self._caches = caches
+        self._indexes, self._aliases = self._build(caches)
+
+    def _build(self, caches: dict) -> Tuple[Dict[str, NameIndex], Dict[str, AliasIndex]]:
+        return self._build_indexes(caches), {name: AliasIndex.from_entries(entries) for name, entries in caches.items()}
+
+    def _use_pack(self, pack: Pack):
+        self._caches = pack.stores
+        self._indexes = pack.indexes if self._engine == TrigramIndex.engine else self._build_indexes(pack.stores)
+        self._aliases = pack.aliases
+        self._fingerprint = (pack.stores, pack.fingerprint)
+
+    async def _load_pack(self, ignore_ua: bool) -> Optional[Pack]:
+        """The pack, if there is one that was built from the files on disk as they are now."""
+        if self.pack_path is None:
+            return None
+        try:
+            pack = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: load_pack(self.pack_path, parsed=self.parsed))
+        except PackError as e:
+            if not isinstance(e.__cause__, FileNotFoundError):
+                log.warning(f'Not using the pack: {e}')
+            return None
+        if pack.ignore_ua != ignore_ua or pack.disk_state != self.disk.state():
+            log.info('The files changed since the pack was written; loading them instead.')
+            return None
+        return pack
+
+    async def _save_pack(self, ignore_ua: bool):
+        if self.pack_path is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            fingerprint = await loop.run_in_executor(None, self.fingerprint)
+            await loop.run_in_executor(None, write_pack, self.pack_path, self._caches, fingerprint,
+                                       self.disk.state(), ignore_ua)
+        except OSError as e:
+            log.warning(f'Could not write the pack: {e!r}')
+
+    def _build_indexes(self, caches: dict) -> Dict[str, NameIndex]:
+        try:
+            return {name: SEARCH_ENGINES[self._engine](entries.keys()) for name, entries in caches.items()}
+        except RuntimeError as e:
+            log.warning(f'Cannot use the {self._engine} search engine ({e}); using the trigram engine.')
+            self._engine = TrigramIndex.engine
+            return {name: TrigramIndex(entries.keys()) for name, entries in caches.items()}
+
+    def _loaded(self, start: float, source: str):
         self._initialized = True
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_from = source
+        log.info(f'Loaded {sum(map(len, self._caches.values()))} entries from {source} in {self.load_seconds:.2f}s.')
 
-    async def _add_json_to_cache(self, url: str, item: str, add_to: str, caches: dict, ignore_ua: bool = True):
-        caches.setdefault(add_to, dict())
-        if url.endswith('index.json'):
-            temp = await get_all_from_index(url, ignore_ua=ignore_ua)
-            caches[add_to].update({x['name'].lower().replace(' (generic)', ''): x
-                                   for source in temp.values() for x in source[item]})
+    async def revalidate(self, ignore_ua: bool = True) -> bool:
+        """Checks every file against 5e.tools and rebuilds the categories of those that changed. Returns whether any did.
+
+        Files that did not change are not read, so when none did this only costs the requests.
+        """
+        if self.disk is None:
+            # There is nothing to revalidate against, so everything is downloaded again.
+            caches, fetcher = await self._load(ignore_ua)
+            self.timings = fetcher.timings
         else:
-            temp = await get_json(url)
-            caches[add_to].update({x['name'].lower().replace(' (generic)', ''): x
-                                   for x in temp[item]})
+            changed = await self._revalidate_files(ignore_ua)
+            if not changed:
+                return False
+            caches, _ = await self._load(ignore_ua, offline=True, categories=changed)
+        loop = asyncio.get_running_loop()
+        indexes, aliases = await loop.run_in_executor(None, self._build, caches)
+        # Replaced rather than updated, so lookups in progress see either the old data or the new.
+        self._caches = {**self._caches, **caches}
+        self._indexes = {**self._indexes, **indexes}
+        self._aliases = {**self._aliases, **aliases}
+        log.info(f'Rebuilt {", ".join(sorted(caches))}.')
+        for listener in self._reload_listeners:
+            listener()
+        await self._save_pack(ignore_ua)
+        return True
+
+    async def _revalidate_files(self, ignore_ua: bool) -> Collection[str]:
+        """Checks the files on disk against 5e.tools and stores new copies. Returns the categories that changed."""
+        start = time.perf_counter()
+        sources = self._source_list()
+        async with aiohttp.ClientSession() as session:
+            fetcher = self._fetcher = Fetcher(session, concurrency=self.concurrency, disk=self.disk)
+            changed = await asyncio.gather(*(self._revalidate_file(url, fetcher, ignore_ua) for (url, _, _) in sources))
+        self.timings = fetcher.timings
+        log.info(f'Revalidated {len(fetcher.timings)} files in {time.perf_counter() - start:.2f}s: '
+                 f'{len(fetcher.changed)} changed, {len(fetcher.not_modified)} not modified.')
+        return {add_to for (_, _, add_to), file_changed in zip(sources, changed) if file_changed}
+
+    async def _revalidate_file(self, url: str, fetcher: Fetcher, ignore_ua: bool) -> bool:
+        changed = await fetcher.revalidate(url)
+        if not url.endswith('index.json'):
+            return changed
+        index = index_files(url, await self.disk.load(url), ignore_ua)
+        files = await asyncio.gather(*(fetcher.revalidate(file_url) for file_url in index.values()))
+        return changed or any(files)
+
+    def add_reload_listener(self, listener: Callable[[], None]):
+        """Calls `listener` whenever revalidating replaces the data."""
+        self._reload_listeners.append(listener)
+
+    def close(self):
+        for task in (self._initializing, self._revalidating):
+            if task is not None:
+                task.cancel()
+
+    async def _load(self, ignore_ua: bool, *, offline: bool = False,
+                    categories: Collection[str] = None) -> Tuple[dict, Fetcher]:
+        """Loads the files of `categories` (or all of them) and builds their stores."""
+        sources = [source for source in self._source_list() if categories is None or source[2] in categories]
+        async with contextlib.AsyncExitStack() as stack:
+            session = None if offline else await stack.enter_async_context(aiohttp.ClientSession())
+            fetcher = self._fetcher = Fetcher(session, concurrency=self.concurrency, disk=self.disk, offline=offline)
+            results = await asyncio.gather(*(self._fetch(url, fetcher, ignore_ua) for (url, _, _) in sources))
+        caches = await asyncio.get_running_loop().run_in_executor(None, self._build_stores, sources, results)
+        return caches, fetcher
+
+    def _build_stores(self, sources: List[Tuple[str, str, str]], results: List[dict]) -> Dict[str, EntryStore]:
+        caches = dict()
+        for (url, item, add_to), data in zip(sources, results):
+            self._add_json_to_cache(url, data, item, add_to, caches)
+        return {name: EntryStore.from_entries(entries.items(), parsed=self.parsed) for name, entries in caches.items()}
+
+    @property
+    def hit_rate(self) -> float:
+        """The share of queries resolved without the fuzzy search."""
+        total = sum(self.lookups.values())
+        return (total - self.lookups['fuzzy']) / total if total else 0.0
+
+    def slowest(self, count: int = None) -> List[Tuple[str, float]]:
+        """The URLs fetched by the last initialization, slowest first, with how long each took."""
+        return sorted(self.timings.items(), key=lambda x: -x[1])[:count]
+
+    @staticmethod
+    async def _fetch(url: str, fetcher: Fetcher, ignore_ua: bool) -> dict:
+        if url.endswith('index.json'):
+            return await get_all_from_index(url, ignore_ua=ignore_ua, fetcher=fetcher)
+        return await fetcher.get_json(url)
+
+    @staticmethod
+    def _add_json_to_cache(url: str, data: dict, item: str, add_to: str, caches: dict):
+        entries = caches.setdefault(add_to, dict())
+        files = data.values() if url.endswith('index.json') else (data,)
+        for file in files:
+            entries.update({x['name'].lower().replace(' (generic)', ''): x for x in file[item]})
+
+    def _resolve(self, name: str, query: str) -> Tuple[Optional[str], str]:
+        """The cache key `query` stands for, if it can be told without a fuzzy search, and how it was found."""
+        query = query.lower()
+        if query in self._caches[name]:
+            return query, 'exact'
+        key = self._aliases[name].lookup(query)
+        return key, 'alias' if key is not None else 'fuzzy'
 
     def _get(self, name: str, query: str) -> Optional[dict]:
-        return self._caches[name].get(query.lower())
+        key, _ = self._resolve(name, query)
+        return self._caches[name].get(key) if key is not None else None
 
     def _get_fuzzy(self, name: str, query: str) -> List[str]:
         # scorer = fuzz.ratio if len(name.split(' ')) < 3 else fuzz.partial_ratio
         # picks = process.extract(query=query.lower(), choices=set(self._caches[name].keys()),
         #                         limit=4, scorer=scorer)
-        query = query.lower()
-        if query in self._caches[name]:
-            return [query]
+        key, found_by = self._resolve(name, query)
+        self.lookups[found_by] += 1
+        if key is not None:
+            return [key]
 
-        choices = set(self._caches[name].keys())
-        picks = dict(process.extract(query=query, choices=choices, limit=5, scorer=fuzz.ratio))
-        for (name, val) in process.extract(query=query, choices=choices, limit=5, scorer=fuzz.partial_ratio):
+        query = query.lower()
+        index = self._indexes[name]
+        picks = dict(index.extract(query, fuzz.ratio, limit=5))
+        for (name, val) in index.extract(query, fuzz.partial_ratio, limit=5):
             picks[name] = max(picks.get(name, 0), val)
         return sorted(picks.keys(), key=lambda x: -picks[x])[:4]
+
+
+def _log_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        log.error('Loading the 5e.tools data in the background failed.', exc_info=task.exception())
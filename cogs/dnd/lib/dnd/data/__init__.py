@@ -1,22 +1,213 @@
 import aiohttp
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+import time
+from typing import Any, Dict, Optional, Set
+from urllib.parse import urlparse
 
+log = logging.getLogger('dnd.data')
 
-async def get_json(url: str) -> dict:
+
+class NotCached(LookupError):
+    pass
+
+
+class DiskCache:
+    """Keeps downloaded files under `root`, along with the ETag and Last-Modified they were served with.
+
+    Files are stored at their URL's path, and the validators in ``manifest.json``. Reading and
+    writing happen in the default executor since the larger files are several megabytes.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._manifest_path = self.root / 'manifest.json'
+        self._manifest: Dict[str, Dict[str, Any]] = {}
+        self._manifest_lock = asyncio.Lock()
+        try:
+            with self._manifest_path.open(encoding='utf-8') as file:
+                self._manifest = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def _path(self, url: str) -> Path:
+        parsed = urlparse(url)
+        return self.root / parsed.netloc / parsed.path.lstrip('/')
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._manifest and self._path(url).is_file()
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """The headers for a conditional GET of `url`, if a copy of it is stored."""
+        entry = self._manifest.get(url)
+        if entry is None or url not in self:
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def state(self) -> Dict[str, Dict[str, str]]:
+        """The validators of every stored file, to tell whether anything changed since."""
+        return {url: self.validators(url) for url in sorted(self._manifest)}
+
+    async def load(self, url: str) -> Any:
+        if url not in self:
+            raise NotCached(url)
+        path = self._path(url)
+        return await asyncio.get_running_loop().run_in_executor(None, self._read, path)
+
+    @staticmethod
+    def _read(path: Path) -> Any:
+        with path.open('rb') as file:
+            return json.loads(file.read())
+
+    async def store(self, url: str, body: bytes, etag: Optional[str], last_modified: Optional[str]):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write, self._path(url), body)
+        # The file is written before the manifest refers to it, so a crash in between leaves no stale validators.
+        async with self._manifest_lock:
+            self._manifest[url] = {'etag': etag, 'last_modified': last_modified, 'fetched': time.time()}
+            manifest = json.dumps(self._manifest, indent='\t').encode('utf-8')
+            await loop.run_in_executor(None, self._write, self._manifest_path, manifest)
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with tmp_path.open('wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+
+class Fetcher:
+    """Downloads JSON files through one session, at most `concurrency` at a time.
+
+    Each request gets `timeout` seconds and is retried up to `retries` times (with exponential
+    backoff) on connection errors, timeouts and 5xx responses. How long the requests for every
+    URL took (not counting time spent waiting for a free slot) is kept in :attr:`timings`.
+
+    With a :class:`DiskCache`, requests are conditional on the stored copy's validators, a 304
+    serves the stored copy, new downloads are stored, and the stored copy is used when a download
+    fails. When `offline`, only the stored copies are used.
+    """
+
+    def __init__(self, session: Optional[aiohttp.ClientSession], *, concurrency: int = 8, timeout: float = 20.0,
+                 retries: int = 2, backoff: float = 0.5, disk: DiskCache = None, offline: bool = False):
+        self.session = session
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.disk = disk
+        self.offline = offline
+        self.timings: Dict[str, float] = {}
+        # URLs whose content was downloaded, and URLs the server said had not changed.
+        self.changed: Set[str] = set()
+        self.not_modified: Set[str] = set()
+        # How many files have been asked for and how many of them are done, to report progress.
+        self.requested = 0
+        self.completed = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_json(self, url: str) -> Any:
+        self.requested += 1
+        data = await self._get_json(url)
+        self.completed += 1
+        return data
+
+    async def revalidate(self, url: str) -> bool:
+        """Checks the stored copy of `url` against the server, storing a new one without parsing it.
+
+        Returns whether it changed. If the server cannot be reached, the stored copy is kept.
+        """
+        self.requested += 1
+        try:
+            body = await self._request(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.warning(f'Revalidating {url} failed ({e!r}); keeping the copy on disk.')
+            body = None
+        self.completed += 1
+        return body is not None
+
+    async def _get_json(self, url: str) -> Any:
+        if self.offline:
+            if self.disk is None:
+                raise NotCached(url)
+            return await self.disk.load(url)
+        try:
+            body = await self._request(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if self.disk is not None and url in self.disk:
+                log.warning(f'Fetching {url} failed ({e!r}); using the copy on disk.')
+                return await self.disk.load(url)
+            raise
+        if body is None:
+            return await self.disk.load(url)
+        return json.loads(body)
+
+    async def _request(self, url: str) -> Optional[bytes]:
+        """Downloads `url` and stores it. Returns None if the stored copy has not changed."""
+        headers = self.disk.validators(url) if self.disk is not None else {}
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    try:
+                        async with self.session.get(url, timeout=self.timeout, headers=headers) as resp:
+                            if resp.status == 304 and headers:
+                                self.not_modified.add(url)
+                                return None
+                            resp.raise_for_status()
+                            body = await resp.read()
+                            etag, last_modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+                    finally:
+                        self.timings[url] = self.timings.get(url, 0.0) + time.perf_counter() - start
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status >= 500
+                if not retryable or attempt == self.retries:
+                    raise
+                log.debug(f'Fetching {url} failed ({e!r}); retrying.')
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                self.changed.add(url)
+                if self.disk is not None:
+                    await self.disk.store(url, body, etag, last_modified)
+                return body
+
+
+async def get_json(url: str, fetcher: Fetcher = None) -> dict:
+    if fetcher is not None:
+        return await fetcher.get_json(url)
     async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            return await resp.json()
+        return await Fetcher(session).get_json(url)
 
 
-async def get_all_from_index(url: str, ignore_ua: bool = True) -> dict:
+async def get_all_from_index(url: str, ignore_ua: bool = True, fetcher: Optional[Fetcher] = None) -> dict:
+    if fetcher is None:
+        async with aiohttp.ClientSession() as session:
+            return await get_all_from_index(url, ignore_ua, Fetcher(session))
+
     if url.endswith('/index.json'):
         url = url[:-len('index.json')]
-    index = await get_json(url + 'index.json')
+    index = index_files(url, await fetcher.get_json(url + 'index.json'), ignore_ua)
+    files = await asyncio.gather(*(fetcher.get_json(file_url) for file_url in index.values()))
+    return dict(zip(index.keys(), files))
+
 
+def index_files(url: str, index: Dict[str, str], ignore_ua: bool = True) -> Dict[str, str]:
+    """The URL of every file listed in the index at `url` (or the directory it is in)."""
+    if url.endswith('/index.json'):
+        url = url[:-len('index.json')]
     if ignore_ua:
         index = {k: v for k, v in index.items() if not k.startswith('UA') and not v.startswith('UA')}
-
-    index = {k: await get_json(url + v) for k, v in index.items()}
-    return index
+    return {k: url + v for k, v in index.items()}
 
 
 async def main(url):
@@ -25,5 +216,4 @@ async def main(url):
 
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main('https://5e.tools/data/spells/index.json'))
@@ -1,6 +1,6 @@
 import discord
 import re
-from typing import List
+from typing import List, NamedTuple, Optional
 
 from core import Context
 from core.formatting import split_text
@@ -54,6 +54,43 @@ def format_fields(text: str, data: dict) -> str:
     return text
 
 
+class Rendered(NamedTuple):
+    """An info object's output: the contents of its messages, or the title and descriptions of its embeds.
+
+    None of it depends on where it is sent, so it can be kept and sent again; the embeds themselves
+    are made when sending.
+    """
+    title: Optional[str]
+    sections: List[str]
+
+    @property
+    def size(self) -> int:
+        return len(self.title or '') + sum(map(len, self.sections))
+
+    async def send(self, ctx: Context, message: discord.Message = None):
+        if self.title is None:
+            contents = self.sections
+            if message is not None:
+                if len(contents) != 1:
+                    await message.delete()
+                    await ctx.send(content=contents[0])
+                else:
+                    await message.edit(content=contents[0])
+            for content in contents[1:]:
+                await ctx.send(content=content)
+            return
+        embeds = [await ctx.default_embed(title=self.title, description=self.sections[0])]
+        for section in self.sections[1:]:
+            embed = await ctx.default_embed(description=section)
+            embed.remove_author()
+            embeds.append(embed)
+        if message is not None:
+            await message.edit(embed=embeds[0])
+            embeds = embeds[1:]
+        for embed in embeds:
+            await ctx.send(embed=embed)
+
+
 class InfoObject:
     def __init__(self, data: dict):
         self.data = data
@@ -72,24 +109,19 @@ class InfoObject:
             ret.append(block)
         return ret
 
+    async def render(self, ctx: Context, embed: bool) -> Rendered:
+        if embed:
+            name_mkd, body_mkd = await self._as_markdown(ctx)
+            return Rendered(name_mkd, InfoObject.split_content(body_mkd, limit=EMBED_CHAR_LIMIT))
+        return Rendered(None, await self._as_message_contents(ctx))
+
     async def send_as_message(self, ctx: Context, message: discord.Message = None):
-        contents = await self._as_message_contents(ctx)
-        if message is not None:
-            if len(contents) != 1:
-                await message.delete()
-                await ctx.send(content=contents[0])
-            else:
-                await message.edit(content=contents[0])
-        for content in contents[1:]:
-            await ctx.send(content=content)
+        rendered = await self.render(ctx, embed=False)
+        await rendered.send(ctx, message)
 
     async def send_as_embed(self, ctx: Context, message: discord.Message = None):
-        embeds = await self._as_embeds(ctx)
-        if message is not None:
-            await message.edit(embed=embeds[0])
-            embeds = embeds[1:]
-        for embed in embeds:
-            await ctx.send(embed=embed)
+        rendered = await self.render(ctx, embed=True)
+        await rendered.send(ctx, message)
 
     async def _as_markdown(self, ctx: Context):
         raise NotImplementedError
@@ -97,13 +129,3 @@ class InfoObject:
     async def _as_message_contents(self, ctx: Context) -> List[str]:
         contents = '\n'.join(await self._as_markdown(ctx))
         return InfoObject.split_content(contents, limit=MESSAGE_CHAR_LIMIT)
-
-    async def _as_embeds(self, ctx: Context) -> List[discord.Embed]:
-        name_mkd, body_mkd = await self._as_markdown(ctx)
-        split_contents = InfoObject.split_content(body_mkd, limit=EMBED_CHAR_LIMIT)
-        ret = [await ctx.default_embed(title=name_mkd, description=split_contents[0])]
-        for content in split_contents[1:]:
-            embed = await ctx.default_embed(description=content)
-            embed.remove_author()
-            ret.append(embed)
-        return ret
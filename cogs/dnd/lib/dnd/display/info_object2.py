@@ -1,7 +1,7 @@
-from discord import Embed, Message
+from discord import Message
 from typing import List, Tuple
 
-from . import utils
+from . import Rendered, utils
 from core import Context
 
 
@@ -22,31 +22,16 @@ class InfoObject2:
         contents = '\n'.join(self._as_markdown())
         return utils.split_content(contents, limit=utils.MESSAGE_CHAR_LIMIT)
 
-    async def _as_embeds(self, ctx: Context) -> List[Embed]:
-        name_mkd, body_mkd = self._as_markdown()
-        split_contents = utils.split_content(body_mkd, limit=utils.EMBED_CHAR_LIMIT)
-        ret = [await ctx.default_embed(title=name_mkd, description=split_contents[0])]
-        for section in split_contents[1:]:
-            embed = await ctx.default_embed(description=section)
-            embed.remove_author()
-            ret.append(embed)
-        return ret
+    async def render(self, ctx: Context, embed: bool) -> Rendered:
+        if embed:
+            name_mkd, body_mkd = self._as_markdown()
+            return Rendered(name_mkd, utils.split_content(body_mkd, limit=utils.EMBED_CHAR_LIMIT))
+        return Rendered(None, self._as_message_contents())
 
     async def send_as_messages(self, ctx: Context, message: Message = None):
-        contents = self._as_message_contents()
-        if message is not None:
-            if len(contents) != 1:
-                await message.delete()
-                await ctx.send(content=contents[0])
-            else:
-                await message.edit(content=contents[0])
-        for content in contents[1:]:
-            await ctx.send(content=content)
+        rendered = await self.render(ctx, embed=False)
+        await rendered.send(ctx, message)
 
     async def send_as_embeds(self, ctx: Context, message: Message = None):
-        embeds = await self._as_embeds(ctx)
-        if message is not None:
-            await message.edit(embed=embeds[0])
-            embeds = embeds[1:]
-        for embed in embeds:
-            await ctx.send(embed=embed)
+        rendered = await self.render(ctx, embed=True)
+        await rendered.send(ctx, message)
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+__all__ = [
+    'LRUMemo',
+]
+
+_V = TypeVar('_V')
+
+
+class LRUMemo(Generic[_V]):
+    """Keeps the most recently used values, at most `max_entries` of them and, if `sizeof` is
+    given, at most `max_bytes` in total as measured by it.
+
+    Values are only made on a miss, by the factory passed to :meth:`get_or_create`. Hits, misses
+    and evictions are counted.
+    """
+
+    def __init__(self, *, max_entries: int = 256, max_bytes: int = None, sizeof: Callable[[_V], int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._values: "OrderedDict[Hashable, _V]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: Hashable) -> Optional[_V]:
+        value = self._values.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._values.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: _V):
+        self.discard(key)
+        self._values[key] = value
+        if self.sizeof is not None:
+            self.size += self.sizeof(value)
+        while len(self._values) > self.max_entries or \
+                (self.max_bytes is not None and self.size > self.max_bytes and len(self._values) > 1):
+            self.discard(next(iter(self._values)))
+            self.evictions += 1
+
+    async def get_or_create(self, key: Hashable, factory: Callable[[], Awaitable[_V]]) -> _V:
+        value = self.get(key)
+        if value is None:
+            value = await factory()
+            self.put(key, value)
+        return value
+
+    def discard(self, key: Hashable):
+        value = self._values.pop(key, None)
+        if value is not None and self.sizeof is not None:
+            self.size -= self.sizeof(value)
+
+    def clear(self):
+        self._values.clear()
+        self.size = 0
@@ -0,0 +1,88 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set
+import unicodedata
+
+__all__ = [
+    'normalize',
+    'AliasIndex',
+]
+
+_QUOTES = re.compile(r"['‘’`\"“”]")
+_GENERIC = re.compile(r'\s*\(generic\)')
+_TRAILING_BONUS = re.compile(r'^(.+?),?\s+\+(\d+)$')
+_NOT_WORD = re.compile(r'[^a-z0-9+]+')
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'sses')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def normalize(name: str) -> str:
+    """Reduces a name to the key it is looked up by.
+
+    Diacritics, case, quotes and punctuation are dropped, "(generic)" is removed, a magic bonus is
+    moved to the front ("Longsword, +1" and "+1 Longsword" are both "+1 longsword"), and every word
+    is made singular.
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    name = _GENERIC.sub('', _QUOTES.sub('', name)).strip()
+    match = _TRAILING_BONUS.match(name)
+    if match is not None:
+        name = f'+{match.group(2)} {match.group(1)}'
+    return ' '.join(_singular(word) for word in _NOT_WORD.split(name) if word)
+
+
+class AliasIndex:
+    """Maps the normalized forms of names and their aliases to the names they belong to.
+
+    A lookup is one normalization and one dict lookup. Keys shared by different names are
+    ambiguous and find nothing, so those queries still go to the fuzzy search.
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, name: str, aliases: Iterable[str] = ()):
+        """Makes `name` (a key of the cache) findable by its own normalized form and those of `aliases`."""
+        for alias in (name, *aliases):
+            key = normalize(alias)
+            if key:
+                self._keys.setdefault(key, set()).add(name)
+
+    def lookup(self, query: str) -> Optional[str]:
+        names = self._keys.get(normalize(query))
+        if names is not None and len(names) == 1:
+            return next(iter(names))
+        return None
+
+    @classmethod
+    def from_entries(cls, entries: Dict[str, dict]) -> 'AliasIndex':
+        """Builds the index for a cache, using the SRD names and aliases 5e.tools gives entries."""
+        index = cls()
+        for name, entry in entries.items():
+            index.add(name, _aliases(entry))
+        return index
+
+
+def _aliases(entry: dict) -> List[str]:
+    aliases = []
+    if isinstance(entry.get('srd'), str):
+        aliases.append(entry['srd'])
+    alias = entry.get('alias')
+    if isinstance(alias, str):
+        aliases.append(alias)
+    elif isinstance(alias, list):
+        aliases.extend(a for a in alias if isinstance(a, str))
+    return aliases
@@ -0,0 +1,267 @@
+from array import array
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+import struct
+import sys
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+from .names import AliasIndex, normalize
+from .search import TrigramIndex
+from .store import EntryStore
+
+__all__ = [
+    'PACK_VERSION',
+    'PackError',
+    'Pack',
+    'load_pack',
+    'write_pack',
+]
+
+MAGIC = b'DNDPACK\0'
+# Bump this whenever the layout changes, so old files are rebuilt instead of misread.
+PACK_VERSION = 1
+# Magic, version and the length of the JSON header that follows.
+_PREAMBLE = struct.Struct('<8sII')
+# A name that is not an alias of exactly one entry.
+_AMBIGUOUS = 0xFFFFFFFF
+
+
+class PackError(ValueError):
+    pass
+
+
+class Pack:
+    """The data and indexes of a :class:`Cache`, read from a file written by :func:`write_pack`.
+
+    The file is mapped into memory rather than read, so loading it only decodes the names and
+    the section offsets. Entries are parsed when they are looked up and trigram postings are read
+    in place, so processes on the same machine share their pages.
+
+    The file starts with :data:`MAGIC`, :data:`PACK_VERSION` and a JSON header that has the
+    fingerprint of the data, the state of the :class:`DiskCache` it was built from and the
+    ``(offset, length)`` of every section. Each category has these sections:
+
+    ``names``, ``processed``, ``keys``, ``trigrams``
+        NUL separated UTF-8: the cache keys, the keys the way fuzzywuzzy scores them, the
+        normalized names and aliases, and every trigram of the processed keys.
+    ``entries``
+        The JSON of every entry, one after the other.
+    ``offsets``
+        Start and end in ``entries`` of every name's JSON.
+    ``key_names``
+        The name each of ``keys`` belongs to, or :data:`_AMBIGUOUS`.
+    ``starts``, ``postings``, ``sizes``
+        The names with each trigram are ``postings[starts[i]:starts[i + 1]]``, and ``sizes``
+        has how many trigrams each name has.
+
+    Integers are unsigned 32 bit in the byte order of the machine that wrote the file.
+    """
+
+    def __init__(self, buffer: mmap.mmap, header: Dict[str, Any], *, parsed: int = 64):
+        self.fingerprint: str = header['fingerprint']
+        self.disk_state: Dict[str, Dict[str, str]] = header['disk_state']
+        self.ignore_ua: bool = header['ignore_ua']
+        self.stores: Dict[str, EntryStore] = {}
+        self.indexes: Dict[str, TrigramIndex] = {}
+        self.aliases: Dict[str, AliasIndex] = {}
+        view = memoryview(buffer)
+        for category, sections in header['categories'].items():
+            def section(name: str) -> memoryview:
+                offset, length = sections[name]
+                if offset + length > len(buffer):
+                    raise PackError(f'The {category} {name} section is past the end of the file.')
+                return view[offset:offset + length]
+
+            def strings(name: str) -> List[str]:
+                text = bytes(section(name)).decode('utf-8')
+                return text.split('\0') if text else []
+
+            names = strings('names')
+            base = sections['entries'][0]
+            offsets = section('offsets').cast('I')
+            self.stores[category] = EntryStore(
+                buffer, {name: (base + offsets[2 * i], base + offsets[2 * i + 1]) for i, name in enumerate(names)},
+                parsed=parsed)
+            self.indexes[category] = PackedTrigramIndex(
+                names, strings('processed'), {trigram: i for i, trigram in enumerate(strings('trigrams'))},
+                section('starts').cast('I'), section('postings').cast('I'), section('sizes').cast('I'))
+            self.aliases[category] = PackedAliasIndex(
+                names, dict(zip(strings('keys'), section('key_names').cast('I'))))
+
+
+class PackedTrigramIndex(TrigramIndex):
+    """A :class:`TrigramIndex` whose postings are read from a :class:`Pack` instead of being built."""
+
+    def __init__(self, names: List[str], processed: List[str], trigrams: Dict[str, int], starts: Mapping[int, int],
+                 postings: memoryview, sizes: memoryview, *, candidates: int = 64, short: int = 8):
+        # Everything NameIndex and TrigramIndex would compute is in the pack.
+        self.names = names
+        self.candidates = candidates
+        self._processed = processed
+        self._short = [i for i, name in enumerate(processed) if len(name) <= short]
+        self._sizes = sizes
+        self._postings = _Postings(trigrams, starts, postings)
+
+
+class _Postings:
+    def __init__(self, trigrams: Dict[str, int], starts: Mapping[int, int], postings: memoryview):
+        self._trigrams = trigrams
+        self._starts = starts
+        self._postings = postings
+
+    def get(self, trigram: str) -> Optional[memoryview]:
+        i = self._trigrams.get(trigram)
+        if i is None:
+            return None
+        return self._postings[self._starts[i]:self._starts[i + 1]]
+
+
+class PackedAliasIndex(AliasIndex):
+    """An :class:`AliasIndex` read from a :class:`Pack`, with the names of ambiguous keys left out."""
+
+    def __init__(self, names: List[str], keys: Dict[str, int]):
+        super(PackedAliasIndex, self).__init__()
+        self._names = names
+        self._ids = keys
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, name: str, aliases=()):
+        raise TypeError('A packed alias index cannot be changed.')
+
+    def lookup(self, query: str) -> Optional[str]:
+        i = self._ids.get(normalize(query))
+        if i is None or i == _AMBIGUOUS:
+            return None
+        return self._names[i]
+
+
+def load_pack(path: Union[str, Path], *, parsed: int = 64) -> Pack:
+    """Maps the pack at `path` into memory. Raises :class:`PackError` if it cannot be used. Blocks."""
+    try:
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise PackError(f'Could not map {path}: {e!r}') from e
+    try:
+        magic, version, length = _PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC:
+            raise PackError(f'{path} is not a pack.')
+        if version != PACK_VERSION:
+            raise PackError(f'{path} is version {version}, not {PACK_VERSION}.')
+        header = json.loads(buffer[_PREAMBLE.size:_PREAMBLE.size + length])
+        if header['byteorder'] != sys.byteorder:
+            raise PackError(f'{path} was written on a {header["byteorder"]} endian machine.')
+        return Pack(buffer, header, parsed=parsed)
+    except PackError:
+        raise
+    except (struct.error, ValueError, KeyError, IndexError, TypeError) as e:
+        raise PackError(f'{path} is corrupt: {e!r}') from e
+
+
+def write_pack(path: Union[str, Path], caches: Mapping[str, Mapping[str, dict]], fingerprint: str,
+               disk_state: Dict[str, Dict[str, str]], ignore_ua: bool = True):
+    """Writes the data of a :class:`Cache` as a pack. Blocks for a moment."""
+    sections: List[bytes] = []
+    categories = {}
+    offset = 0
+
+    def add(data: Union[bytes, array]) -> Tuple[int, int]:
+        nonlocal offset
+        data = data.tobytes() if isinstance(data, array) else data
+        # Integer sections are cast in place, so every section starts on a multiple of 4.
+        padding = -len(data) % 4
+        sections.append(data + b'\0' * padding)
+        start, offset = offset, offset + len(data) + padding
+        return start, len(data)
+
+    for category, entries in caches.items():
+        if not isinstance(entries, EntryStore):
+            entries = EntryStore.from_entries(entries.items())
+        names = list(entries)
+        ids = {name: i for i, name in enumerate(names)}
+        index = TrigramIndex(names)
+        aliases = AliasIndex.from_entries(entries)
+        trigrams = sorted(index._postings)
+        keys = sorted(aliases._keys)
+
+        blob = bytearray()
+        offsets = array('I')
+        for name in names:
+            start, end = entries.span(name)
+            offsets.extend((len(blob), len(blob) + end - start))
+            blob += entries.buffer[start:end]
+        starts, postings = array('I', [0]), array('I')
+        for trigram in trigrams:
+            postings.extend(index._postings[trigram])
+            starts.append(len(postings))
+        key_names = array('I', (ids[next(iter(aliases._keys[key]))] if len(aliases._keys[key]) == 1 else _AMBIGUOUS
+                                for key in keys))
+
+        categories[category] = {
+            'names': add('\0'.join(names).encode('utf-8')),
+            'processed': add('\0'.join(index._processed).encode('utf-8')),
+            'keys': add('\0'.join(keys).encode('utf-8')),
+            'trigrams': add('\0'.join(trigrams).encode('utf-8')),
+            'entries': add(bytes(blob)),
+            'offsets': add(offsets),
+            'key_names': add(key_names),
+            'starts': add(starts),
+            'postings': add(postings),
+            'sizes': add(array('I', index._sizes)),
+        }
+
+    def encode_header(shift: int) -> bytes:
+        shifted = {category: {name: (start + shift, length) for name, (start, length) in sections.items()}
+                   for category, sections in categories.items()}
+        return json.dumps({'byteorder': sys.byteorder, 'fingerprint': fingerprint, 'disk_state': disk_state,
+                           'ignore_ua': ignore_ua, 'categories': shifted}, separators=(',', ':')).encode('utf-8')
+
+    # The sections come after the header, whose length depends on the offsets written in it.
+    shift = 0
+    header = encode_header(shift)
+    while _PREAMBLE.size + len(header) + (-len(header) % 4) != shift:
+        shift = _PREAMBLE.size + len(header) + (-len(header) % 4)
+        header = encode_header(shift)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with tmp_path.open('wb') as file:
+        file.write(_PREAMBLE.pack(MAGIC, PACK_VERSION, len(header)))
+        file.write(header + b'\0' * (-len(header) % 4))
+        for data in sections:
+            file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+async def main(cache_dir: Path, output: Path, offline: bool):
+    from .cache import Cache
+    cache = Cache(cache_dir=cache_dir, packed=False, offline=offline)
+    await cache.initialize()
+    if cache.revalidating:
+        await cache._revalidating
+    cache.close()
+    write_pack(output, cache.data, cache.fingerprint(), cache.disk.state())
+    print(f'Wrote {sum(map(len, cache.data.values()))} entries to {output} ({output.stat().st_size / 2 ** 20:.1f} MiB).')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Packs the D&D data into the file the DnD cog maps at startup.')
+    parser.add_argument('--cache-dir', type=Path, default=Path('cogs', 'dnd', 'cache'),
+                        help='where the downloaded 5e.tools files are kept')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='the pack to write (default: index.pack in the cache directory)')
+    parser.add_argument('--offline', action='store_true',
+                        help='if files were downloaded before, use them without checking for new ones')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.cache_dir, args.output or args.cache_dir / 'index.pack', args.offline))
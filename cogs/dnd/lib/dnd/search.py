@@ -0,0 +1,143 @@
+from collections import Counter
+from fuzzywuzzy import utils
+import heapq
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Type
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = [
+    'NameIndex',
+    'TrigramIndex',
+    'BigramMatrixIndex',
+    'SEARCH_ENGINES',
+]
+
+Scorer = Callable[[str, str], int]
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f' {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Finds the names that score best against a query, like fuzzywuzzy's ``process.extract``,
+    without scoring every name.
+
+    Subclasses pick the candidates worth scoring. Every engine scores the names that overlap the
+    most with the query as a whole (which is what ``fuzz.ratio`` rewards) and the names that
+    overlap the most relative to the shorter of the two (``fuzz.partial_ratio`` rewards one being
+    contained in the other), `candidates` of each. Names of `short` characters or fewer can match
+    part of a query closely without sharing anything else with it, so they are always scored. If
+    fewer than the requested number of names overlap with the query at all, every name is scored.
+    """
+    engine: str = None
+
+    def __init__(self, names: Iterable[str], *, candidates: int = 64, short: int = 8):
+        self.names = list(names)
+        self.candidates = candidates
+        # Names the way fuzzywuzzy scores them: letters and digits only, lowercase.
+        self._processed = [utils.full_process(name) for name in self.names]
+        self._short = [i for i, name in enumerate(self._processed) if len(name) <= short]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _candidates(self, query: str, limit: int) -> Iterable[int]:
+        raise NotImplementedError
+
+    def extract(self, query: str, scorer: Scorer, limit: int = 5) -> List[Tuple[str, int]]:
+        """The `limit` best ``(name, score)`` pairs for `query` according to `scorer`, best first."""
+        query = utils.full_process(query)
+        scored = ((self.names[i], scorer(query, self._processed[i])) for i in self._candidates(query, limit))
+        return heapq.nlargest(limit, scored, key=lambda x: x[1])
+
+
+class TrigramIndex(NameIndex):
+    """Maps every trigram to the names that contain it; the overlap is the number of shared trigrams."""
+    engine = 'trigram'
+
+    def __init__(self, names: Iterable[str], **kwargs):
+        super(TrigramIndex, self).__init__(names, **kwargs)
+        self._sizes: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        for i, name in enumerate(self._processed):
+            trigrams = _trigrams(name)
+            self._sizes.append(len(trigrams))
+            for trigram in trigrams:
+                self._postings.setdefault(trigram, []).append(i)
+
+    def _candidates(self, query: str, limit: int) -> Iterable[int]:
+        trigrams = _trigrams(query)
+        shared = Counter()
+        for trigram in trigrams:
+            postings = self._postings.get(trigram)
+            if postings is not None:
+                shared.update(postings)
+        if len(shared) < limit:
+            return range(len(self.names))
+        size, sizes = len(trigrams), self._sizes
+        overall = heapq.nlargest(self.candidates, shared, key=lambda i: shared[i] / (size + sizes[i]))
+        contained = heapq.nlargest(self.candidates, shared, key=lambda i: shared[i] / min(size, sizes[i]))
+        return set(overall).union(contained, self._short)
+
+
+class BigramMatrixIndex(NameIndex):
+    """Scores the character bigram overlap of the query with every name at once, with NumPy.
+
+    The names are packed into a padded matrix of code points, from which a bigrams x names matrix
+    is built that marks which bigrams each name contains. Names only use a few hundred distinct
+    bigrams, so it stays small, and with a row per bigram the overlap of a query with every name
+    is the sum of the query's rows.
+    """
+    engine = 'bigram'
+
+    def __init__(self, names: Iterable[str], **kwargs):
+        if np is None:
+            raise RuntimeError('The bigram search engine needs NumPy.')
+        super(BigramMatrixIndex, self).__init__(names, **kwargs)
+        count = len(self._processed)
+        padded = [f' {name} ' for name in self._processed]
+        codes = np.zeros((count, max(map(len, padded), default=2)), dtype=np.uint32)
+        for i, name in enumerate(padded):
+            codes[i, :len(name)] = np.frombuffer(name.encode('utf-32-le'), dtype=np.uint32)
+        # Bigrams as 64 bit keys, numbered by their position in the sorted vocabulary.
+        valid = codes[:, 1:] != 0
+        rows = np.nonzero(valid)[0]
+        keys = (codes[:, :-1].astype(np.uint64) << np.uint64(32) | codes[:, 1:])[valid]
+        self._vocabulary, columns = np.unique(keys, return_inverse=True)
+        self._matrix = np.zeros((len(self._vocabulary), count), dtype=np.uint8)
+        self._matrix[columns.reshape(-1), rows] = 1
+        self._sizes = self._matrix.sum(axis=0, dtype=np.int32)
+
+    def _query_bigrams(self, query: str) -> Tuple['np.ndarray', int]:
+        """The rows of the query's bigrams that any name has, and how many distinct bigrams it has."""
+        padded = np.frombuffer(f' {query} '.encode('utf-32-le'), dtype=np.uint32)
+        keys = np.unique(padded[:-1].astype(np.uint64) << np.uint64(32) | padded[1:])
+        rows = np.searchsorted(self._vocabulary, keys)
+        known = rows < len(self._vocabulary)
+        known[known] = self._vocabulary[rows[known]] == keys[known]
+        return rows[known], len(keys)
+
+    def _candidates(self, query: str, limit: int) -> Iterable[int]:
+        rows, size = self._query_bigrams(query)
+        shared = self._matrix[rows].sum(axis=0, dtype=np.int32)
+        matching = np.flatnonzero(shared)
+        if len(matching) < limit:
+            return range(len(self.names))
+        shared, sizes = shared[matching], self._sizes[matching]
+        overall = matching[_top(shared / (size + sizes), self.candidates)]
+        contained = matching[_top(shared / np.minimum(size, sizes), self.candidates)]
+        return set(overall.tolist()).union(contained.tolist(), self._short)
+
+
+def _top(scores: 'np.ndarray', count: int) -> 'np.ndarray':
+    if len(scores) <= count:
+        return np.arange(len(scores))
+    return np.argpartition(-scores, count)[:count]
+
+
+SEARCH_ENGINES: Dict[str, Type[NameIndex]] = {cls.engine: cls for cls in (TrigramIndex, BigramMatrixIndex)}
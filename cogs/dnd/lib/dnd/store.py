@@ -0,0 +1,66 @@
+import json
+import mmap
+from typing import Dict, Iterable, Iterator, Mapping, Tuple, Union
+
+from .memo import LRUMemo
+
+__all__ = [
+    'EntryStore',
+]
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+class EntryStore(Mapping[str, dict]):
+    """Entries by name, kept as JSON in one buffer and parsed when they are looked up.
+
+    Most entries are never looked up, so instead of keeping every entry's dict tree around, each
+    one is serialized into :attr:`buffer` (bytes, or a mapped file) and found through an index of
+    offsets. The last `parsed` entries looked up stay parsed. Iterating over :meth:`values` or
+    :meth:`items` parses every entry without keeping them.
+    """
+
+    def __init__(self, buffer: Buffer, offsets: Dict[str, Tuple[int, int]], *, parsed: int = 64):
+        self.buffer = buffer
+        self._offsets = offsets
+        self._parsed: LRUMemo[dict] = LRUMemo(max_entries=parsed)
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Tuple[str, dict]], *, parsed: int = 64) -> 'EntryStore':
+        buffer = bytearray()
+        offsets = {}
+        for name, entry in entries:
+            start = len(buffer)
+            buffer += json.dumps(entry, sort_keys=True, separators=(',', ':')).encode('utf-8')
+            offsets[name] = (start, len(buffer))
+        return cls(bytes(buffer), offsets, parsed=parsed)
+
+    def span(self, name: str) -> Tuple[int, int]:
+        """Where the JSON of an entry is in :attr:`buffer`."""
+        return self._offsets[name]
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._offsets)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._offsets
+
+    def __getitem__(self, name: str) -> dict:
+        entry = self._parsed.get(name)
+        if entry is None:
+            entry = self._parse(name)
+            self._parsed.put(name, entry)
+        return entry
+
+    def _parse(self, name: str) -> dict:
+        start, end = self._offsets[name]
+        return json.loads(self.buffer[start:end])
+
+    def values(self) -> Iterator[dict]:
+        return (self._parse(name) for name in self._offsets)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        return ((name, self._parse(name)) for name in self._offsets)
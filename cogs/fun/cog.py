@@ -5,11 +5,14 @@ from discord.ext import commands
 from googleapiclient.discovery import build
 from io import BytesIO
 import random as rand
+import time
 from typing import Optional, Union
 
-from core import Config, Context, Patbot, utils, permissions as perms
+from core import Config, Context, Patbot, concurrency, utils, permissions as perms
 from core.formatting import success, warning, error, fatal, info, format_time
 from core.menus import Confirm
+from core.outbound import Priority
+from core.response_cache import cached_response
 from .resources.pokedex import pokedex
 
 
@@ -41,17 +44,28 @@ class Fun(commands.Cog):
         )
 
     async def _init_petition(self):
-        if self.bot._current_petition is not None and self._current_listener is None:
-            try:
-                start_time: int = self.bot._current_petition['start']
-                start_time: datetime.datetime = datetime.datetime.fromordinal(start_time)
-                await self.bot.wait_for('on_petition_end',
-                                        timeout=float((60*60*24) - (datetime.datetime.now() - start_time).seconds))
-            finally:
-                message = self.bot.get_channel(self.bot._current_petition['channel'])
-                message = await message.fetch_message(self.bot._current_petition['message'])
-                ctx = await self.bot.get_context(message)
-                await self._end_petition(ctx)
+        current = self.bot._current_petition
+        if current is not None:
+            if 'deadline' not in current:
+                start_time = datetime.datetime.fromordinal(current['start'])
+                current['deadline'] = start_time.timestamp() + 60 * 60 * 24
+            self._schedule_petition_end()
+
+    def _schedule_petition_end(self):
+        # The job lives on the bot so a reloaded cog can replace the old instance's.
+        job = getattr(self.bot, '_petition_job', None)
+        if job is not None:
+            job.cancel()
+        self.bot._petition_job = self.bot.scheduler.call_at(self.bot._current_petition['deadline'],
+                                                            self._finish_petition)
+
+    async def _finish_petition(self):
+        if self.bot._current_petition is None:
+            return
+        message = self.bot.get_channel(self.bot._current_petition['channel'])
+        message = await message.fetch_message(self.bot._current_petition['message'])
+        ctx = await self.bot.get_context(message)
+        await self._end_petition(ctx)
 
     async def get_image(self, ctx: Context, name: str) -> Optional[discord.File]:
         if name in self._images:
@@ -84,6 +98,7 @@ class Fun(commands.Cog):
             return list(filter(lambda msg: any(x + query in msg.content.lower() for x in {' ', '~', '-'}), quotes))
 
     @perms.meme_team()
+    @concurrency.limit(1, queue=4)
     @commands.command(name='randomquote', aliases=['rq'])
     async def _randomquote(self, ctx: Context, *, query: str = None):
         """Retrieves a random quote that contains the query.
@@ -142,6 +157,7 @@ class Fun(commands.Cog):
         finally:
             pass
 
+    @concurrency.limit(2, queue=4)
     @commands.command(name='pokefusion', aliases=['pf'])
     async def _pokefusion(self, ctx: Context, *, pokemon: str):
         """Pokefusion! Only works with the first 151 Pokemon.
@@ -242,7 +258,7 @@ class Fun(commands.Cog):
                 message = await ctx.channel.fetch_message(current['message'])
                 await message.edit(embed=await self._get_petition_embed(ctx))
             else:
-                self.bot.dispatch('on_petition_end')
+                await self._finish_petition()
         return vote_listener
 
     @perms.meme_team()
@@ -273,18 +289,16 @@ class Fun(commands.Cog):
             'votes': [0, 0, 0],
             'channel': ctx.channel.id,
             'start': datetime.datetime.now().toordinal(),
+            'deadline': time.time() + 60 * 60 * 24,
             'voters': []
         }
         await message.edit(content=None, embed=await self._get_petition_embed(ctx))
-        await message.pin()
+        self.bot.outbound.schedule(Priority.COSMETIC, message.pin, key=('pin', message.id))
         await ctx.react(success)
         listener = self._get_vote_listener(ctx.channel.id)
         self._current_listener = listener
         self.bot.add_listener(listener, 'on_message')
-        try:
-            await self.bot.wait_for('on_petition_end', timeout=float(60 * 60 * 24))
-        finally:
-            await ctx.invoke(self._petition_stop)
+        self._schedule_petition_end()
 
     @perms.meme_team()
     @_petition.command(name='stop')
@@ -301,6 +315,10 @@ class Fun(commands.Cog):
         _emoji = ':scales:'
         self.bot.remove_listener(self._current_listener, name='on_message')
         self._current_listener = None
+        job = getattr(self.bot, '_petition_job', None)
+        if job is not None:
+            job.cancel()
+            self.bot._petition_job = None
         current = self.bot._current_petition
         votes = current['votes']
         message = self.bot.get_channel(self.bot._current_petition['channel'])
@@ -315,6 +333,7 @@ class Fun(commands.Cog):
         await message.edit(embed=emb)
         self.bot._current_petition = None
 
+    @concurrency.limit(2, queue=4)
     @commands.command(name='meme')
     async def _meme(self, ctx: Context, *, query: str):
         """Searches Google for memes."""
@@ -429,6 +448,7 @@ class Fun(commands.Cog):
                 return await ctx.send_help(ctx.command)
             return await self._display_counter(ctx, name, counters[name])
 
+    @cached_response()
     @_counter.command('list')
     async def _counter_list(self, ctx: Context):
         """Lists the server's counters.
@@ -1,30 +1,118 @@
+import asyncio
 from collections import OrderedDict
 import discord
 from discord.ext import commands
 from discord.ext.commands import Greedy
+import logging
 import re
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
-from cogs.polling.core.polling import SimpleDynamicPoll, AnonymousDynamicPoll, SimpleStaticPoll
+from cogs.polling.core.polling import (SimpleDynamicPoll, AnonymousDynamicPoll, SimpleStaticPoll, Poll, POLL_TYPES,
+                                       DEADLINE_JOB_KIND)
+from cogs.polling.core.store import PollStore
+from cogs.polling.core.tally import TALLY_TYPES
 
 from core import Config, Context, Patbot, CommandArgument
 from core.formatting import success, warning, error, fatal, info
 from core import permissions as perms
+from core import tracing
+from core.scheduler import ScheduledJob
+
+log = logging.getLogger('polling')
 
 
 class Polling(commands.Cog):
     """A template cog to use as a starting point for creating new ones. Doesn't have any commands of its own."""
+
+    # How many saved polls are fetched and recounted at once after a restart.
+    REHYDRATE_CONCURRENCY = 4
+    # Discord allows at most 20 different reactions on a message.
+    MAX_OPTIONS = 20
+
     def __init__(self, bot: Patbot):
         self.bot = bot
         self.config = Config.get_config(cog_instance=self)
         self._register_defaults()
+        self.store = PollStore(self.config)
+        tracing.detached(self.bot.loop.create_task, self._rehydrate_polls())
+
+    def cog_unload(self):
+        self.bot.scheduler.unregister(DEADLINE_JOB_KIND)
+        for poll in list(self.store.polls.values()):
+            poll.detach()
+        self.bot.loop.create_task(self.store.flush())
+
+    async def _rehydrate_polls(self):
+        await self.bot.wait_until_ready()
+        await self.bot.scheduler.load()
+        states = await self.store.load()
+        semaphore = asyncio.Semaphore(self.REHYDRATE_CONCURRENCY)
+        await asyncio.gather(*(self._rehydrate_poll(int(message_id), state, semaphore)
+                               for message_id, state in states.items()))
+        # Deadlines that passed while the bot was offline are run as soon as this is registered.
+        self.bot.scheduler.register(DEADLINE_JOB_KIND, self._on_poll_deadline)
+        if states:
+            log.info(f'Rehydrated {len(self.store.polls)} of {len(states)} saved polls.')
+
+    async def _rehydrate_poll(self, message_id: int, state: Dict[str, Any], semaphore: asyncio.Semaphore):
+        async with semaphore:
+            channel = self.bot.get_channel(state['channel'])
+            if channel is None:
+                log.info(f'Dropping saved poll {message_id}; its channel is gone.')
+                self._forget_poll(message_id)
+                return
+            try:
+                message = await channel.fetch_message(message_id)
+                poll = await POLL_TYPES[state['kind']].from_state(self.bot, message, state, store=self.store)
+                reactions = await self._fetch_reactions(poll) if poll.listens else {}
+            except (discord.NotFound, discord.Forbidden, KeyError):
+                log.info(f'Dropping saved poll {message_id}; its message is gone.')
+                self._forget_poll(message_id)
+                return
+            except discord.HTTPException:
+                log.exception(f'Failed to rehydrate poll {message_id}.')
+                return
+            await poll.resume(reactions)
+
+    async def _fetch_reactions(self, poll: Poll) -> Dict[str, Set[int]]:
+        options = {str(emoji) for emoji in poll.options}
+        reactions = {}
+        for reaction in poll.message.reactions:
+            emoji = str(reaction.emoji)
+            if emoji not in options:
+                continue
+            if reaction.count <= int(reaction.me):
+                reactions[emoji] = set()
+                continue
+            # Pages through the users 100 per request.
+            reactions[emoji] = {user.id async for user in reaction.users() if user.id != self.bot.user.id}
+        return reactions
+
+    def _forget_poll(self, message_id: int):
+        self.store.remove(message_id)
+        job = self.bot.scheduler.get_persistent(Poll.deadline_job_id(message_id))
+        if job is not None:
+            job.cancel()
+
+    async def _on_poll_deadline(self, job: ScheduledJob):
+        message_id = job.payload['message']
+        poll = self.store.polls.get(message_id)
+        if poll is None:
+            self._forget_poll(message_id)
+            return
+        await poll.close()
 
     def _register_defaults(self):
+        self.config.register_global(
+            edit_interval=2.0,
+            polls={}
+        )
         self.config.register_guild(
             enabled=True,
             commands={
                 'polltest': True
-            }
+            },
+            edit_interval=2.0
         )
 
     @staticmethod
@@ -45,12 +133,14 @@ class Polling(commands.Cog):
             'options': options
         }
 
-    @staticmethod
-    def _map_emojis(options: Sequence[str]) -> OrderedDict:
+    @classmethod
+    def _map_emojis(cls, options: Sequence[str]) -> OrderedDict:
         if len(options) < 10:  # Use numbers
             em = ['{}\N{COMBINING ENCLOSING KEYCAP}'.format(str(x)) for x in range(1, 10)]
+        elif len(options) <= cls.MAX_OPTIONS:  # Use letters
+            em = [chr(ord('\N{REGIONAL INDICATOR SYMBOL LETTER A}') + x) for x in range(cls.MAX_OPTIONS)]
         else:
-            raise ValueError('Must be at most 9 options')
+            raise commands.BadArgument(f'A poll can have at most {cls.MAX_OPTIONS} options.')
         return OrderedDict(**{em[i - 1]: option for i, option in enumerate(options, start=1)})
 
     @staticmethod
@@ -65,10 +155,20 @@ class Polling(commands.Cog):
         else:
             return None
 
+    @staticmethod
+    def _convert_mode_arg(arg) -> str:
+        lowered = str(arg).lower()
+        if lowered not in TALLY_TYPES:
+            raise commands.BadArgument(f'"{arg}" is not a poll mode. Use one of: {", ".join(TALLY_TYPES)}.')
+        return lowered
+
     @classmethod
     def _convert_poll_args(cls, ctx: Context, args: List[Tuple[str, Optional[str]]]):
         valid_args = {
-            ('anon', 'a', 'anonymous'): cls._convert_bool_arg
+            ('anon', 'a', 'anonymous'): cls._convert_bool_arg,
+            ('mode', 'm'): cls._convert_mode_arg,
+            ('static', 's'): cls._convert_bool_arg,
+            ('dedupe', 'd'): cls._convert_bool_arg,
         }
         found_args = {}
         args = dict(args)
@@ -89,6 +189,10 @@ class Polling(commands.Cog):
     async def _poll(self, ctx: Context, args: Greedy[CommandArgument], title: str, *options: str):
         """Start a poll.
         You can optionally make the poll anonymous by putting "-anon" before the title (ex. !!poll -anon Title etc.)
+        By default everyone picks one option. Use "-mode=approval" to let people pick every option they like,
+        or "-mode=ranked" to have them pick options in order of preference and decide the winner by instant runoff.
+        For very large polls, "-static" only counts the reactions once, when the poll closes; add "-dedupe" to leave out
+        people who voted for more than one option. Static polls cannot be anonymous or use another mode.
         An example:
 
             !!poll "Which Jolly Rancher?" Green Blue Purple "None of them"
@@ -98,12 +202,19 @@ class Polling(commands.Cog):
         """
         args = args or []
         args = self._convert_poll_args(ctx, args)
+        options = self._map_emojis(options)
+        if args.get('static', False) is True:
+            # Static polls count plain single-choice reactions once; nothing else would take effect.
+            if args.get('anon', False) is True or (args.get('mode') or 'single') != 'single':
+                raise commands.BadArgument('A static poll cannot be anonymous or use a mode other than single.')
+            poll = SimpleStaticPoll(title, options, dedupe=args.get('dedupe', False) is True, store=self.store)
+            return await poll.start(ctx)
         if args.get('anon', False) is True:
             poll_class = AnonymousDynamicPoll
         else:
             poll_class = SimpleDynamicPoll
-        options = self._map_emojis(options)
-        poll = poll_class(title, options)
+        poll = poll_class(title, options, mode=args.get('mode') or 'single',
+                          edit_interval=await self.config.from_ctx(ctx, 'edit_interval'), store=self.store)
         return await poll.start(ctx)
 
 
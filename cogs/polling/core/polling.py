@@ -2,42 +2,153 @@ import asyncio
 from collections import deque, OrderedDict
 import discord
 from discord.ext import commands
-from typing import Optional
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
 
-from core import Context, DiscordEmojiConverter
+from cogs.polling.core.tally import Tally, SingleChoiceTally, TALLY_TYPES
+from core import Context, DiscordEmojiConverter, Patbot
+from core.metrics import metrics
+from core.outbound import Priority
+from core.reactions import seed_reactions
+from core.scheduler import ScheduledJob
+
+if TYPE_CHECKING:
+    from cogs.polling.core.store import PollStore
 
 EmojiConverter = DiscordEmojiConverter()
 
+# Kind of the scheduler jobs that close polls kept in a PollStore.
+DEADLINE_JOB_KIND = 'poll'
+
+MODE_FOOTERS = {
+    'approval': 'Choose every option you approve of.',
+    'ranked': 'Choose options in order of preference. The winner is decided by instant runoff.',
+}
+
 
 class Poll:
-    def __init__(self, name: str, options: OrderedDict, *, timeout: float = float(60 * 60 * 12)):
+    # Whether the poll handles reaction events while it is open.
+    listens = True
+
+    def __init__(self, name: str, options: OrderedDict, *, timeout: float = float(60 * 60 * 12),
+                 edit_interval: float = 2.0, store: "PollStore" = None):
         self.name = name
         self.options = options
         self.message = None
         self.bot = None
         self.timeout = timeout
+        self.deadline: Optional[float] = None
+        self.edit_interval = edit_interval
+        self.store = store
         self._running = True
         self._lock = asyncio.Lock()
-        self.__task = None
+        self._deadline_job: Optional[ScheduledJob] = None
+        self._edit_job: Optional[ScheduledJob] = None
+        self._seeding: Optional[asyncio.Task] = None
 
     async def start(self, ctx: Context, channel: discord.TextChannel = None):
+        started = time.perf_counter()
         self.options = OrderedDict(
             **{await EmojiConverter.convert(ctx, emoji): text for emoji, text in self.options.items()})
         self.bot = ctx.bot
+        if self.message is not None:
+            self.stop()
         self.message = await self.send_message(ctx, channel)
-        if self.__task is not None:
-            self.__task.cancel()
-        self._running = True
-        self.__task = self.bot.loop.create_task(self._internal_loop())
+        self.deadline = time.time() + self.timeout
+        self._attach()
+        # Votes are taken from here on, while the option reactions are still being added.
+        self._seeding = seed_reactions(self.message, self.options, kind='poll')
+        metrics.timer('time_to_interactive_seconds', kind='poll').observe(time.perf_counter() - started)
 
-        for emoji in self.options:
-            await self.message.add_reaction(emoji)
+    def _attach(self):
+        self._running = True
+        if self.listens:
+            self.bot.reactions.subscribe(self.message.id, self._on_raw_reaction)
+        if self.store is None:
+            self._deadline_job = self.bot.scheduler.call_at(self.deadline, self.close)
+        else:
+            # Persistent, so the poll still closes on time after a restart.
+            job_id = self.deadline_job_id(self.message.id)
+            self._deadline_job = self.bot.scheduler.get_persistent(job_id) or self.bot.scheduler.schedule_persistent(
+                DEADLINE_JOB_KIND, self.deadline, {'message': self.message.id}, job_id=job_id)
+            self.store.add(self)
+
+    @staticmethod
+    def deadline_job_id(message_id: int) -> str:
+        return f'poll-{message_id}'
+
+    def detach(self):
+        """Stops listening for votes without closing the poll, e.g. when the Polling cog is unloaded."""
+        self._running = False
+        if self._seeding is not None:
+            self._seeding.cancel()
+            self._seeding = None
+        if self.message is not None:
+            self.bot.reactions.unsubscribe(self.message.id, self._on_raw_reaction)
+        if self._edit_job is not None:
+            self._edit_job.cancel()
+            self._edit_job = None
 
     def stop(self):
-        self._running = False
-        if self.__task is not None:
-            self.__task.cancel()
-            self.__task = None
+        self.detach()
+        if self._deadline_job is not None:
+            self._deadline_job.cancel()
+            self._deadline_job = None
+        if self.store is not None and self.message is not None:
+            self.store.remove(self.message.id)
+
+    async def close(self):
+        self.stop()
+        await self.on_timeout()
+
+    def to_state(self) -> Dict[str, Any]:
+        """Returns what is needed to rehydrate this poll after a restart."""
+        return {
+            'kind': type(self).__name__,
+            'channel': self.message.channel.id,
+            'name': self.name,
+            'options': [[str(emoji), text] for emoji, text in self.options.items()],
+            'deadline': self.deadline,
+            'edit_interval': self.edit_interval,
+        }
+
+    @classmethod
+    async def from_state(cls, bot: Patbot, message: discord.Message, state: Dict[str, Any],
+                         store: "PollStore" = None) -> "Poll":
+        options = OrderedDict()
+        for emoji, text in state['options']:
+            options[await EmojiConverter.convert(None, emoji)] = text
+        poll = cls(state['name'], options, edit_interval=state['edit_interval'], store=store,
+                   **cls._init_kwargs(state))
+        poll.bot = bot
+        poll.message = message
+        poll.deadline = state['deadline']
+        poll.restore(state)
+        return poll
+
+    @classmethod
+    def _init_kwargs(cls, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Extra constructor arguments to rebuild this kind of poll from its saved state."""
+        return {}
+
+    def restore(self, state: Dict[str, Any]):
+        self.embed = self.message.embeds[0] if self.message.embeds else None
+
+    async def resume(self, reactions: Dict[str, Set[int]]):
+        """Picks a rehydrated poll back up.
+
+        `reactions` maps each option to the ids of the users reacting with it on the poll message now.
+        """
+        self._attach()
+        # Finishes seeding if the bot stopped before all the options were added.
+        self._seeding = seed_reactions(self.message, self.options, kind='poll')
+        async with self._lock:
+            if self.reconcile(reactions) is not False:
+                self._request_update()
+
+    def reconcile(self, reactions: Dict[str, Set[int]]) -> Optional[bool]:
+        """Brings the saved votes in line with the message's current reactions."""
+        return False
 
     def reaction_check(self, payload: discord.RawReactionActionEvent) -> bool:
         if payload.user_id == self.bot.user.id:
@@ -46,25 +157,9 @@ class Poll:
             return False
         return payload.emoji in self.options
 
-    async def _internal_loop(self):
-        try:
-            loop = self.bot.loop
-            while self._running:
-                tasks = [
-                    asyncio.ensure_future(self.bot.wait_for('raw_reaction_add', check=self.reaction_check)),
-                    asyncio.ensure_future(self.bot.wait_for('raw_reaction_remove', check=self.reaction_check)),
-                ]
-                done, pending = await asyncio.wait(tasks, timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED)
-                for task in pending:
-                    task.cancel()
-
-                if len(done) == 0:
-                    raise asyncio.TimeoutError
-
-                payload = done.pop().result()
-                loop.create_task(self.update(payload))
-        except asyncio.TimeoutError:
-            await self.on_timeout()
+    def _on_raw_reaction(self, payload: discord.RawReactionActionEvent):
+        if self.reaction_check(payload):
+            return self.update(payload)
 
     async def update(self, payload: discord.RawReactionActionEvent):
         async with self._lock:
@@ -75,8 +170,24 @@ class Poll:
                     do_update = await self.on_reaction_remove(payload)
                 else:
                     raise ValueError
+                metrics.counter('poll_votes_total').inc()
                 if do_update is not False:
-                    await self.update_message()
+                    self._request_update()
+                if self.store is not None:
+                    self.store.save(self)
+
+    def _request_update(self):
+        # Votes are counted right away, but the message is edited at most once per `edit_interval`,
+        # on the trailing edge, so a burst of votes turns into a single edit.
+        if self._edit_job is not None:
+            metrics.counter('poll_edits_saved_total', reason='coalesced').inc()
+            return
+        self._edit_job = self.bot.scheduler.call_later(self.edit_interval, self._flush_update)
+
+    async def _flush_update(self):
+        self._edit_job = None
+        if self._running:
+            await self.update_message()
 
     async def send_message(self, ctx: Context, channel: discord.TextChannel) -> discord.Message:
         raise NotImplementedError
@@ -95,16 +206,32 @@ class Poll:
 
 
 class SimpleStaticPoll(Poll):
-    """Does not update poll display when a vote is received"""
+    """Does not update poll display when a vote is received.
+
+    No reaction events are handled while the poll is open; the votes are read from the message's
+    reaction counts once, when it closes. With `dedupe`, the voters of every option are fetched
+    as well and people who voted for more than one option are not counted.
+    """
+    listens = False
 
-    def __init__(self, name: str, options: OrderedDict, **kwargs):
+    def __init__(self, name: str, options: OrderedDict, *, dedupe: bool = False, **kwargs):
         super(SimpleStaticPoll, self).__init__(name, options, **kwargs)
         self.embed: Optional[discord.Embed] = None
+        self.dedupe = dedupe
         self._author_id = None
 
+    def to_state(self) -> Dict[str, Any]:
+        state = super(SimpleStaticPoll, self).to_state()
+        state['dedupe'] = self.dedupe
+        return state
+
+    @classmethod
+    def _init_kwargs(cls, state: Dict[str, Any]) -> Dict[str, Any]:
+        return {'dedupe': state.get('dedupe', False)}
+
     async def send_message(self, ctx: Context, channel: discord.TextChannel) -> discord.Message:
         self._author_id = ctx.author.id
-        embed = await ctx.default_embed(title=self.name)
+        embed = self.embed = await ctx.default_embed(title=self.name)
         if ctx.author.avatar_url:
             embed.set_author(name=f'Started by {ctx.author.display_name}', icon_url=ctx.author.avatar_url)
         else:
@@ -121,25 +248,87 @@ class SimpleStaticPoll(Poll):
         pass
 
     async def on_reaction_add(self, payload: discord.RawReactionActionEvent) -> Optional[bool]:
-        pass
+        return False
 
     async def on_reaction_remove(self, payload: discord.RawReactionActionEvent) -> Optional[bool]:
-        pass
+        return False
+
+    async def count_votes(self) -> Tuple[List[int], int]:
+        """Fetches the poll message and returns the votes for each option and how many voters were dropped."""
+        message = await self.message.channel.fetch_message(self.message.id)
+        index = {str(emoji): i for i, emoji in enumerate(self.options)}
+        reactions = [None] * len(index)
+        for reaction in message.reactions:
+            i = index.get(str(reaction.emoji))
+            if i is not None:
+                reactions[i] = reaction
+        counts = [0 if r is None else r.count - int(r.me) for r in reactions]
+        if not self.dedupe:
+            return counts, 0
+        seen: Dict[int, int] = {}
+        for i, reaction in enumerate(reactions):
+            if not counts[i]:
+                continue
+            async for user in reaction.users():
+                if user.id != self.bot.user.id:
+                    seen[user.id] = -1 if user.id in seen else i
+        counts = [0] * len(reactions)
+        for choice in seen.values():
+            if choice >= 0:
+                counts[choice] += 1
+        return counts, sum(1 for choice in seen.values() if choice < 0)
 
     async def on_timeout(self) -> None:
+        counts, dropped = await self.count_votes()
+        for i, ((emoji, text), count) in enumerate(zip(self.options.items(), counts)):
+            self.embed.set_field_at(i, name=str(emoji), value=f'{text}\n**{count}** vote{"" if count == 1 else "s"}',
+                                    inline=False)
+        if dropped:
+            self.embed.set_footer(text=f'Not counted: {dropped} voter{"" if dropped == 1 else "s"} '
+                                       f'who chose more than one option.')
         self.embed.title = f'[CLOSED] {self.embed.title}'
         await self.message.edit(embed=self.embed)
 
 
 class SimpleDynamicPoll(Poll):
     """Updates poll display when a vote is received"""
+    # Cleaning up reactions is cosmetic for polls that are not anonymous.
+    REMOVAL_PRIORITY = Priority.COSMETIC
 
-    def __init__(self, name: str, options: OrderedDict, **kwargs):
+    def __init__(self, name: str, options: OrderedDict, *, mode: str = SingleChoiceTally.mode, **kwargs):
         super(SimpleDynamicPoll, self).__init__(name, options, **kwargs)
         self.embed: Optional[discord.Embed] = None
         self._author_id = None
-        self.votes = {str(emoji): 0 for emoji in self.options}
-        self.voters = {}
+        # Options are referred to by their position in the tally.
+        self._emojis = [str(emoji) for emoji in self.options]
+        self._index = {emoji: i for i, emoji in enumerate(self._emojis)}
+        self.tally: Tally = TALLY_TYPES[mode](len(self._emojis))
+        self._rendered = None
+
+    def to_state(self) -> Dict[str, Any]:
+        state = super(SimpleDynamicPoll, self).to_state()
+        state['mode'] = self.tally.mode
+        state['voters'] = self.tally.to_state()
+        return state
+
+    @classmethod
+    def _init_kwargs(cls, state: Dict[str, Any]) -> Dict[str, Any]:
+        return {'mode': state.get('mode', SingleChoiceTally.mode)}
+
+    def restore(self, state: Dict[str, Any]):
+        super(SimpleDynamicPoll, self).restore(state)
+        self.tally.load(state.get('voters', {}))
+        if self.embed is not None:
+            self._rendered = [field.value for field in self.embed.fields]
+
+    def reconcile(self, reactions: Dict[str, Set[int]]) -> Optional[bool]:
+        reacting = {}
+        for emoji, users in reactions.items():
+            for user_id in users:
+                reacting.setdefault(user_id, []).append(self._index[emoji])
+        for user_id, option in self.tally.reconcile(reacting):
+            self._remove_reaction(self._emojis[option], user_id)
+        return True
 
     async def create_embed(self, ctx: Context, channel: discord.TextChannel) -> discord.Embed:
         embed = await ctx.default_embed(title=self.name)
@@ -147,66 +336,99 @@ class SimpleDynamicPoll(Poll):
             embed.set_author(name=f'Started by {ctx.author.display_name}', icon_url=ctx.author.avatar_url)
         else:
             embed.set_author(name=f'Started by {ctx.author.display_name}')
-        for emoji, text in self.options.items():
-            embed.add_field(name=f'{emoji} ({text})', value='0', inline=False)
+        for (emoji, text), value in zip(self.options.items(), self.tally.display()):
+            embed.add_field(name=f'{emoji} ({text})', value=value, inline=False)
+        footer = MODE_FOOTERS.get(self.tally.mode)
+        if footer is not None:
+            embed.set_footer(text=footer)
         return embed
 
     async def send_message(self, ctx: Context, channel: discord.TextChannel) -> discord.Message:
         self._author_id = ctx.author.id
         embed = self.embed = await self.create_embed(ctx, channel)
+        self._rendered = self.tally.display()
         if channel is None or channel == ctx.channel:
             return await ctx.send(embed=embed)
         else:
             return await channel.send(embed=embed)
 
+    def render_tally(self) -> bool:
+        """Writes the current result into the embed. Returns False if it looks the same as last time."""
+        rendered = self.tally.display()
+        if rendered == self._rendered:
+            return False
+        for i, ((emoji, text), value) in enumerate(zip(self.options.items(), rendered)):
+            self.embed.set_field_at(i, name=f'{emoji} ({text})', value=value, inline=False)
+        self._rendered = rendered
+        return True
+
     async def update_message(self):
-        for i, (emoji, text) in enumerate(self.options.items()):
-            self.embed.set_field_at(i, name=f'{emoji} ({text})', value=str(self.votes[str(emoji)]), inline=False)
-        await self.message.edit(embed=self.embed)
+        if not self.render_tally():
+            metrics.counter('poll_edits_saved_total', reason='unchanged').inc()
+            return
+        metrics.counter('poll_edits_total').inc()
+        async with self.bot.outbound.reply():
+            await self.message.edit(embed=self.embed)
 
     async def on_reaction_add(self, payload: discord.RawReactionActionEvent) -> Optional[bool]:
-        user_id = payload.user_id
-        emoji = payload.emoji
-        if user_id in self.voters:
-            await self.message.remove_reaction(self.voters[user_id], self.bot.get_user(user_id))
-            self.votes[self.voters[user_id]] -= 1
-        self.votes[str(emoji)] += 1
-        self.voters[user_id] = str(emoji)
+        replaced = self.tally.add(payload.user_id, self._index[str(payload.emoji)])
+        if replaced is not None:
+            self._remove_reaction(self._emojis[replaced], payload.user_id)
         return True
 
     async def on_reaction_remove(self, payload: discord.RawReactionActionEvent) -> Optional[bool]:
-        user_id = payload.user_id
-        if self.voters[user_id] == str(payload.emoji):
-            self.votes[str(payload.emoji)] -= 1
-            del self.voters[user_id]
+        self.tally.remove(payload.user_id, self._index[str(payload.emoji)])
         return True
 
     async def on_timeout(self) -> None:
+        self.render_tally()
         self.embed.title = f'[CLOSED] {self.embed.title}'
         await self.message.edit(embed=self.embed)
 
+    def _remove_reaction(self, emoji: str, user_id: int):
+        # Cleaning up reactions must not hold up the tally or the embed edit.
+        member = discord.Object(id=user_id)
+        self.bot.outbound.schedule(self.REMOVAL_PRIORITY, lambda: self.message.remove_reaction(emoji, member),
+                                   key=('unreact', self.message.id, emoji, user_id))
+
 
 class AnonymousDynamicPoll(SimpleDynamicPoll):
+    # Removing the reaction is what keeps the vote anonymous, so it must not be dropped.
+    REMOVAL_PRIORITY = Priority.NORMAL
+
     def __init__(self, *args, **kwargs):
         super(AnonymousDynamicPoll, self).__init__(*args, **kwargs)
 
     async def create_embed(self, ctx: Context, channel: discord.TextChannel) -> discord.Embed:
         embed = await super(AnonymousDynamicPoll, self).create_embed(ctx, channel)
-        embed.set_footer(text='This poll is anonymous. To remove your vote, choose the same option again.')
+        footer = 'This poll is anonymous. To remove your vote, choose the same option again.'
+        if self.tally.mode in MODE_FOOTERS:
+            footer = f'{MODE_FOOTERS[self.tally.mode]}\n{footer}'
+        embed.set_footer(text=footer)
         return embed
 
     async def on_reaction_add(self, payload: discord.RawReactionActionEvent) -> Optional[bool]:
-        user_id = payload.user_id
-        emoji = payload.emoji
-        if user_id in self.voters and self.voters[user_id] == str(emoji):
-            self.votes[self.voters[user_id]] -= 1
-            del self.voters[user_id]
-        else:
-            if user_id in self.voters:
-                self.votes[self.voters[user_id]] -= 1
-            self.votes[str(emoji)] += 1
-            self.voters[user_id] = str(emoji)
-        return await self.message.remove_reaction(str(emoji), self.bot.get_user(user_id))
+        self._toggle_vote(payload.user_id, str(payload.emoji))
+        return True
+
+    def _toggle_vote(self, user_id: int, emoji: str):
+        # The reaction for a replaced choice was already removed when it was counted.
+        self.tally.toggle(user_id, self._index[emoji])
+        self._remove_reaction(emoji, user_id)
+
+    def reconcile(self, reactions: Dict[str, Set[int]]) -> Optional[bool]:
+        # A reaction left over was either cast while offline or already counted before its removal
+        # was lost, so it is recorded if it is not yet, but never toggled off.
+        for emoji, users in reactions.items():
+            option = self._index[emoji]
+            for user_id in users:
+                if option not in self.tally.ballot(user_id):
+                    self.tally.add(user_id, option)
+                self._remove_reaction(emoji, user_id)
+        return True
 
     async def on_reaction_remove(self, payload: discord.RawReactionActionEvent) -> Optional[bool]:
         pass
+
+
+POLL_TYPES = {cls.__name__: cls for cls in (SimpleStaticPoll, SimpleDynamicPoll, AnonymousDynamicPoll)}
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from core import Config, tracing
+
+if TYPE_CHECKING:
+    from cogs.polling.core.polling import Poll
+
+__all__ = [
+    'PollStore',
+]
+
+
+class PollStore:
+    """Keeps track of the open polls and saves their state to the Polling config.
+
+    Each poll is stored as the compact dict returned by :meth:`Poll.to_state`, keyed by its message
+    id. Changes are written at most once every `save_delay` seconds; anything lost to a crash in
+    between is recovered from the poll message's reactions when the poll is rehydrated.
+    """
+
+    def __init__(self, config: Config, *, save_delay: float = 5.0):
+        self.config = config
+        self.save_delay = save_delay
+        self.polls: Dict[int, "Poll"] = {}
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._save_task: Optional[asyncio.Task] = None
+        # Whether anything changed since the polls were last written.
+        self._dirty = False
+
+    async def load(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the saved state of every poll that was open when the bot last stopped."""
+        saved = await self.config.polls() or {}
+        for message_id, state in saved.items():
+            self._states.setdefault(message_id, state)
+        return dict(self._states)
+
+    def add(self, poll: "Poll"):
+        self.polls[poll.message.id] = poll
+        self._save_later()
+
+    def save(self, poll: "Poll"):
+        """Marks a poll's state as changed."""
+        if self.polls.get(poll.message.id) is poll:
+            self._save_later()
+
+    def remove(self, message_id: int):
+        self.polls.pop(message_id, None)
+        self._states.pop(str(message_id), None)
+        self._save_later()
+
+    def _save_later(self):
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = tracing.detached(asyncio.ensure_future, self._save())
+
+    async def _save(self):
+        # Changes made while a write is in progress are saved by another round.
+        while self._dirty:
+            await asyncio.sleep(self.save_delay)
+            await self._write()
+
+    async def flush(self):
+        """Saves any pending changes right away."""
+        if self._save_task is not None and not self._save_task.done():
+            self._save_task.cancel()
+        self._save_task = None
+        await self._write()
+
+    async def _write(self):
+        self._dirty = False
+        for message_id, poll in self.polls.items():
+            self._states[str(message_id)] = poll.to_state()
+        await self.config.polls.set(self._states)
@@ -0,0 +1,335 @@
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Type
+
+__all__ = [
+    'Tally',
+    'SingleChoiceTally',
+    'ApprovalTally',
+    'RankedChoiceTally',
+    'TALLY_TYPES',
+]
+
+
+def _zeros(size: int) -> array:
+    return array('I', bytes(4 * size))
+
+
+class Tally:
+    """Counts the votes of a poll with `options` options, which are referred to by their position.
+
+    Every vote event updates the result incrementally; nothing is recomputed from all ballots
+    unless it has to be.
+    """
+    mode: str = None
+
+    def __init__(self, options: int):
+        self.options = options
+
+    def __len__(self) -> int:
+        """The number of voters."""
+        raise NotImplementedError
+
+    def ballot(self, voter: int) -> Sequence[int]:
+        """The options `voter` has chosen, in the order they chose them."""
+        raise NotImplementedError
+
+    def add(self, voter: int, option: int) -> Optional[int]:
+        """Records that `voter` chose `option`. Returns an option they no longer have chosen, if any."""
+        raise NotImplementedError
+
+    def remove(self, voter: int, option: int):
+        raise NotImplementedError
+
+    def toggle(self, voter: int, option: int) -> Optional[int]:
+        if option in self.ballot(voter):
+            self.remove(voter, option)
+            return None
+        return self.add(voter, option)
+
+    def reconcile(self, reacting: Dict[int, List[int]]) -> List[Tuple[int, int]]:
+        """Replaces the ballots with the options each voter is reacting with now.
+
+        Returns the ``(voter, option)`` reactions that do not count and should be removed.
+        """
+        raise NotImplementedError
+
+    def display(self) -> List[str]:
+        """The result to show next to each option."""
+        raise NotImplementedError
+
+    def to_state(self) -> Dict[int, Any]:
+        raise NotImplementedError
+
+    def load(self, state: Dict[str, Any]):
+        raise NotImplementedError
+
+
+class SingleChoiceTally(Tally):
+    """Each voter has one choice; choosing another option moves their vote."""
+    mode = 'single'
+
+    def __init__(self, options: int):
+        super(SingleChoiceTally, self).__init__(options)
+        self.counts = _zeros(options)
+        self.voters: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.voters)
+
+    def ballot(self, voter: int) -> Sequence[int]:
+        choice = self.voters.get(voter)
+        return () if choice is None else (choice,)
+
+    def add(self, voter: int, option: int) -> Optional[int]:
+        previous = self.voters.get(voter)
+        if previous == option:
+            return None
+        if previous is not None:
+            self.counts[previous] -= 1
+        self.counts[option] += 1
+        self.voters[voter] = option
+        return previous
+
+    def remove(self, voter: int, option: int):
+        if self.voters.get(voter) == option:
+            self.counts[option] -= 1
+            del self.voters[voter]
+
+    def reconcile(self, reacting: Dict[int, List[int]]) -> List[Tuple[int, int]]:
+        # Keep each voter's saved choice while they still react with it; otherwise take their new reaction.
+        extra = []
+        voters = {}
+        for voter, options in reacting.items():
+            previous = self.voters.get(voter)
+            choice = previous if previous in options else options[0]
+            voters[voter] = choice
+            extra.extend((voter, option) for option in options if option != choice)
+        self.load(voters)
+        return extra
+
+    def display(self) -> List[str]:
+        return list(map(str, self.counts))
+
+    def to_state(self) -> Dict[int, int]:
+        return self.voters
+
+    def load(self, state: Dict[str, int]):
+        self.voters = {int(voter): choice for voter, choice in state.items()}
+        self.counts = _zeros(self.options)
+        for choice in self.voters.values():
+            self.counts[choice] += 1
+
+
+class ApprovalTally(Tally):
+    """Each voter approves of any number of options. Ballots are stored as bit masks."""
+    mode = 'approval'
+
+    def __init__(self, options: int):
+        super(ApprovalTally, self).__init__(options)
+        self.counts = _zeros(options)
+        self.voters: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.voters)
+
+    def ballot(self, voter: int) -> Sequence[int]:
+        mask = self.voters.get(voter, 0)
+        return [i for i in range(self.options) if mask >> i & 1]
+
+    def add(self, voter: int, option: int) -> Optional[int]:
+        mask = self.voters.get(voter, 0)
+        if not mask >> option & 1:
+            self.counts[option] += 1
+            self.voters[voter] = mask | 1 << option
+        return None
+
+    def remove(self, voter: int, option: int):
+        mask = self.voters.get(voter, 0)
+        if mask >> option & 1:
+            self.counts[option] -= 1
+            mask &= ~(1 << option)
+            if mask:
+                self.voters[voter] = mask
+            else:
+                del self.voters[voter]
+
+    def toggle(self, voter: int, option: int) -> Optional[int]:
+        if self.voters.get(voter, 0) >> option & 1:
+            self.remove(voter, option)
+            return None
+        return self.add(voter, option)
+
+    def reconcile(self, reacting: Dict[int, List[int]]) -> List[Tuple[int, int]]:
+        voters = {}
+        for voter, options in reacting.items():
+            mask = 0
+            for option in options:
+                mask |= 1 << option
+            voters[voter] = mask
+        self.load(voters)
+        return []
+
+    def display(self) -> List[str]:
+        return list(map(str, self.counts))
+
+    def to_state(self) -> Dict[int, int]:
+        return self.voters
+
+    def load(self, state: Dict[str, int]):
+        self.voters = {int(voter): mask for voter, mask in state.items() if mask}
+        self.counts = _zeros(self.options)
+        for mask in self.voters.values():
+            for i in range(self.options):
+                if mask >> i & 1:
+                    self.counts[i] += 1
+
+
+class _Round:
+    __slots__ = ('counts', 'winner', 'loser')
+
+    def __init__(self, counts: array, winner: Optional[int], loser: Optional[int]):
+        self.counts = counts
+        self.winner = winner
+        self.loser = loser
+
+
+class RankedChoiceTally(Tally):
+    """Each voter ranks options in the order they choose them; the result is decided by instant runoff.
+
+    Every elimination round is memoized. When a ballot changes, each round it counts towards
+    differently is adjusted in place, and only the rounds after the first one whose outcome
+    changes are recomputed, the next time the result is needed.
+    """
+    mode = 'ranked'
+
+    def __init__(self, options: int):
+        super(RankedChoiceTally, self).__init__(options)
+        self.ballots: Dict[int, List[int]] = {}
+        self._rounds: List[_Round] = []
+        # Index of the first round that has to be recomputed, or None when all are up to date.
+        self._stale: Optional[int] = 0
+
+    def __len__(self) -> int:
+        return len(self.ballots)
+
+    def ballot(self, voter: int) -> Sequence[int]:
+        return self.ballots.get(voter, ())
+
+    def add(self, voter: int, option: int) -> Optional[int]:
+        ranking = self.ballots.get(voter, [])
+        if option not in ranking:
+            self._replace(voter, ranking, ranking + [option])
+        return None
+
+    def remove(self, voter: int, option: int):
+        ranking = self.ballots.get(voter)
+        if ranking is not None and option in ranking:
+            self._replace(voter, ranking, [o for o in ranking if o != option])
+
+    def reconcile(self, reacting: Dict[int, List[int]]) -> List[Tuple[int, int]]:
+        # Options still reacted with keep their rank; new reactions are ranked after them.
+        ballots = {}
+        for voter, options in reacting.items():
+            kept = [o for o in self.ballots.get(voter, ()) if o in options]
+            ballots[voter] = kept + [o for o in options if o not in kept]
+        self.load(ballots)
+        return []
+
+    @property
+    def rounds(self) -> List[_Round]:
+        if self._stale is not None:
+            self._compute_from(self._stale)
+            self._stale = None
+        return self._rounds
+
+    @property
+    def winner(self) -> Optional[int]:
+        rounds = self.rounds
+        return rounds[-1].winner if rounds else None
+
+    def display(self) -> List[str]:
+        rounds = self.rounds
+        if not rounds:
+            return ['0'] * self.options
+        final = rounds[-1]
+        eliminated = {r.loser: i for i, r in enumerate(rounds, start=1) if r.loser is not None}
+        shown = []
+        for option in range(self.options):
+            if option in eliminated:
+                shown.append(f'Eliminated in round {eliminated[option]}')
+            elif option == final.winner:
+                shown.append(f'{final.counts[option]} (leading)')
+            else:
+                shown.append(str(final.counts[option]))
+        return shown
+
+    def to_state(self) -> Dict[int, List[int]]:
+        return self.ballots
+
+    def load(self, state: Dict[str, List[int]]):
+        self.ballots = {int(voter): list(ranking) for voter, ranking in state.items() if ranking}
+        self._stale = 0
+
+    @staticmethod
+    def _first_choice(ranking: Sequence[int], eliminated: Set[int]) -> Optional[int]:
+        for option in ranking:
+            if option not in eliminated:
+                return option
+        return None
+
+    def _decide(self, counts: array, eliminated: Set[int]) -> Tuple[Optional[int], Optional[int]]:
+        """Returns ``(winner, loser)`` for a round: who wins, or else who is eliminated."""
+        active = [i for i in range(self.options) if i not in eliminated]
+        total = sum(counts)
+        if not total or not active:
+            return None, None
+        leader = max(active, key=lambda i: (counts[i], -i))
+        if counts[leader] * 2 > total or len(active) == 1:
+            return leader, None
+        # Ties are broken against the option listed last.
+        return None, min(active, key=lambda i: (counts[i], -i))
+
+    def _replace(self, voter: int, old: Sequence[int], new: List[int]):
+        if new:
+            self.ballots[voter] = new
+        else:
+            self.ballots.pop(voter, None)
+        limit = len(self._rounds) if self._stale is None else self._stale
+        eliminated = set()
+        for i in range(limit):
+            current = self._rounds[i]
+            before = self._first_choice(old, eliminated)
+            after = self._first_choice(new, eliminated)
+            if before != after:
+                if before is not None:
+                    current.counts[before] -= 1
+                if after is not None:
+                    current.counts[after] += 1
+                outcome = self._decide(current.counts, eliminated)
+                if outcome != (current.winner, current.loser):
+                    current.winner, current.loser = outcome
+                    self._stale = i + 1
+                    return
+            if current.loser is None:
+                return
+            eliminated.add(current.loser)
+
+    def _compute_from(self, start: int):
+        del self._rounds[start:]
+        eliminated = {r.loser for r in self._rounds}
+        if self._rounds and self._rounds[-1].loser is None:
+            return
+        while True:
+            counts = _zeros(self.options)
+            for ranking in self.ballots.values():
+                choice = self._first_choice(ranking, eliminated)
+                if choice is not None:
+                    counts[choice] += 1
+            winner, loser = self._decide(counts, eliminated)
+            self._rounds.append(_Round(counts, winner, loser))
+            if loser is None:
+                return
+            eliminated.add(loser)
+
+
+TALLY_TYPES: Dict[str, Type[Tally]] = {cls.mode: cls for cls in (SingleChoiceTally, ApprovalTally, RankedChoiceTally)}
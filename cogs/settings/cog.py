@@ -6,6 +6,7 @@ from core import Config, Context, Patbot
 from core.formatting import humanize_list
 from core.formatting import success, warning, error, fatal, format_time
 from core import permissions as perms
+from core.response_cache import cached_response
 
 
 class Settings(commands.Cog):
@@ -26,6 +27,7 @@ class Settings(commands.Cog):
         )
 
     @commands.guild_only()
+    @cached_response(ttl=300.0)
     @commands.command(name='settings')
     async def _settings(self, ctx: Context):
         """Displays Patbot's settings for the current server."""
@@ -319,6 +321,33 @@ class Settings(commands.Cog):
         return await ctx.react_or_send(success, f'Command messages will {"not " if time == 0 else ""} be deleted'
                                                 f'{"" if time == 0 else f" after {formatted_time}"}.')
 
+    @commands.guild_only()
+    @perms.guildowner_or_permissions(administrator=True)
+    @commands.command(name='concurrency', aliases=['busylimit'])
+    async def _concurrency(self, ctx: Context, name: str, limit: int = None, queue: int = 0):
+        """Set how many uses of a command (or of a whole cog) may run at once on this server.
+        Permissions: Server owner only, or users with "administrator" permissions.
+
+        Up to `queue` more uses will wait for their turn; anything beyond that is turned away.
+        Leave out the limit to go back to Patbot's default for that command or cog.
+        """
+        command = ctx.bot.get_command(name)
+        cog = ctx.bot.get_cog(name)
+        if command is None and cog is None:
+            return await ctx.send(error, f'No command or cog named `{name}` exists.')
+        name = command.qualified_name if command is not None else cog.qualified_name
+        async with ctx.bot.config.guild(ctx).concurrency() as current:
+            if limit is None:
+                current.pop(name, None)
+            elif limit < 1 or queue < 0:
+                return await ctx.send(error, 'The limit must be at least 1 and the queue must not be negative.')
+            else:
+                current[name] = {'limit': limit, 'queue': queue}
+        if limit is None:
+            return await ctx.react_or_send(success, f'`{name}` is back to its default limit on this server.')
+        return await ctx.react_or_send(success, f'At most {limit} `{name}` command{"" if limit == 1 else "s"} '
+                                                f'will run at once on this server, with {queue} waiting.')
+
 
 def setup(bot):
     bot.add_cog(Settings(bot))
@@ -5,9 +5,18 @@ from discord.ext import commands
 from pathlib import Path
 import sys
 
+from core.concurrency import ConcurrencyManager
 from core.config import Config
 from core.context import Context
+from core import errors
 from core import formatting as fmt
+from core import tracing
+from core.deletion import DeletionWheel
+from core.outbound import OutboundScheduler
+from core.ratelimits import RateLimitTelemetry
+from core.reactions import ReactionRouter
+from core.response_cache import ResponseCache
+from core.scheduler import Scheduler
 
 
 class Patbot(commands.AutoShardedBot):
@@ -17,8 +26,9 @@ class Patbot(commands.AutoShardedBot):
         ext_to_preload = {'cogmanager', 'core', 'dnd', 'fun', 'polling', 'repl', 'settings'}
 
         async def command_prefix(bot, message: discord.Message):
-            prefixes = await self.config.from_ctx(message, 'prefixes') or ['p!']
-            return commands.when_mentioned_or(*prefixes)(bot, message)
+            with tracing.span('command_prefix'):
+                prefixes = await self.config.from_ctx(message, 'prefixes') or ['p!']
+                return commands.when_mentioned_or(*prefixes)(bot, message)
 
         options['command_prefix'] = command_prefix
         if 'owner_id' in options:
@@ -31,6 +41,17 @@ class Patbot(commands.AutoShardedBot):
 
         super(Patbot, self).__init__(**options)
 
+        self.concurrency = ConcurrencyManager(self.config)
+        self.response_cache = ResponseCache()
+        self.outbound = OutboundScheduler()
+        self.deletions = DeletionWheel(self)
+        self.scheduler = Scheduler(self.config)
+        self.reactions = ReactionRouter()
+        self.http_telemetry = RateLimitTelemetry()
+        self.http_telemetry.install(self.http)
+        self.before_invoke(self._before_command)
+        self.after_invoke(self._after_command)
+
         # Preload extensions as necessary
         for ext in ext_to_preload:
             self.load_cog(ext)
@@ -40,11 +61,18 @@ class Patbot(commands.AutoShardedBot):
 
     async def on_ready(self):
         self.__version__ = '.'.join(map(str, await self.config.version()))
+        await self.scheduler.load()
         if not self._testing:
             await self.change_presence(activity=discord.Game('!!help'))
         else:
             await self.change_presence(activity=discord.Game('Patbot testing'))
 
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        self.reactions.dispatch(payload)
+
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        self.reactions.dispatch(payload)
+
     async def shutdown(self):
         await self.logout()
         for task in asyncio.Task.all_tasks():
@@ -57,17 +85,47 @@ class Patbot(commands.AutoShardedBot):
         sys.exit(3)
 
     async def get_context(self, message, *, cls=Context):
-        return await super().get_context(message, cls=cls)
+        with tracing.span('get_context'):
+            return await super().get_context(message, cls=cls)
 
     async def process_commands(self, message: discord.Message):
         if not message.author.bot:
-            ctx = await self.get_context(message)
-            await self.invoke(ctx)
+            with tracing.trace('message', message_id=message.id) as trace:
+                ctx = await self.get_context(message)
+                if ctx.command is None:
+                    trace.discard()
+                else:
+                    trace.name = ctx.command.qualified_name
+                await self.invoke(ctx)
         else:
             ctx = None
         if ctx is None or ctx.valid is False:
             self.dispatch('message_without_command', message)
 
+    async def invoke(self, ctx: Context):
+        with tracing.span('invoke', command=ctx.command):
+            # Checks and argument conversion run before the before-invoke hook, which ends this span.
+            ctx._prepare_span = tracing.start_span('checks and converters')
+            try:
+                await super(Patbot, self).invoke(ctx)
+            finally:
+                if ctx._prepare_span is not None:
+                    ctx._prepare_span.finish()
+
+    async def _before_command(self, ctx: Context):
+        prepare_span = getattr(ctx, '_prepare_span', None)
+        if prepare_span is not None:
+            prepare_span.finish()
+        with tracing.span('concurrency limit'):
+            await self.concurrency.acquire(ctx)
+        ctx._callback_span = tracing.start_span('callback', command=ctx.command.qualified_name)
+
+    async def _after_command(self, ctx: Context):
+        callback_span = getattr(ctx, '_callback_span', None)
+        if callback_span is not None:
+            callback_span.finish()
+        self.concurrency.release(ctx)
+
     async def accepts_embeds(self, ctx: commands.Context):
         return await self.config.from_ctx(ctx, 'accepts_embeds')
 
@@ -111,5 +169,7 @@ class Patbot(commands.AutoShardedBot):
                 return await ctx.send_help(ctx.command)
         if isinstance(exception, commands.BadArgument):
             return await ctx.send(fmt.error, str(exception))
+        if isinstance(exception, errors.CommandBusy):
+            return await ctx.send(fmt.warning, "I'm busy with too many of those right now. Try again in a moment.")
         await ctx.send(fmt.fatal, f'An uncaught {exception.__class__.__name__} occurred: {exception}')
         raise exception
@@ -0,0 +1,213 @@
+import asyncio
+from collections import deque
+from discord.ext import commands
+import time
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Tuple, TypeVar
+
+from core import errors
+from core.config import Config
+from core.metrics import metrics
+
+__all__ = [
+    'LimitSpec',
+    'Limiter',
+    'ConcurrencyManager',
+    'limit',
+]
+
+_T = TypeVar('_T')
+
+SPEC_ATTR = '__patbot_concurrency__'
+
+
+class LimitSpec(NamedTuple):
+    concurrency: int
+    queue: int
+    per: commands.BucketType
+
+
+class Limiter:
+    """A semaphore with a bounded queue of waiters.
+
+    At most `concurrency` holders run at once and at most `queue` callers
+    may wait for a slot; any further caller is rejected immediately.
+    """
+
+    def __init__(self, scope: str, concurrency: int, queue: int, *, key: Any = None):
+        self.scope = scope
+        self.key = key
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._queue_depth = metrics.gauge('concurrency_queue_depth', scope=scope)
+        self._active = metrics.gauge('concurrency_active', scope=scope)
+        self._wait_time = metrics.timer('concurrency_wait_seconds', scope=scope)
+        self._rejected = metrics.counter('concurrency_rejected_total', scope=scope)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and not self._waiters
+
+    async def acquire(self) -> bool:
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self._active.inc()
+            self._wait_time.observe(0.0)
+            return True
+        if len(self._waiters) >= self.queue:
+            self._rejected.inc()
+            return False
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._queue_depth.inc()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us as we were cancelled; pass it on.
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+                self._queue_depth.dec()
+            raise
+        self._wait_time.observe(time.perf_counter() - start)
+        return True
+
+    def release(self):
+        while self._waiters:
+            future = self._waiters.popleft()
+            self._queue_depth.dec()
+            if not future.done():
+                # Hand the slot directly to the next waiter; `active` stays the same.
+                future.set_result(None)
+                return
+        self.active -= 1
+        self._active.dec()
+
+
+class ConcurrencyManager:
+    """Applies the concurrency limits declared with :func:`limit` around command invocations.
+
+    Limits can be overridden per guild (or globally) through the core config's ``concurrency``
+    value, which maps a command's qualified name or a cog's name to ``{"limit": n, "queue": m}``.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self._limiters: Dict[Tuple[str, Any], Limiter] = {}
+
+    @staticmethod
+    def _bucket_key(ctx: commands.Context, per: commands.BucketType) -> Any:
+        if per is commands.BucketType.default:
+            return None
+        if per is commands.BucketType.guild:
+            return ctx.guild.id if ctx.guild is not None else ctx.author.id
+        if per is commands.BucketType.channel:
+            return ctx.channel.id
+        if per is commands.BucketType.user:
+            return ctx.author.id
+        if per is commands.BucketType.member:
+            return (ctx.guild and ctx.guild.id), ctx.author.id
+        if per is commands.BucketType.category:
+            return (ctx.channel.category or ctx.channel).id
+        if per is commands.BucketType.role:
+            return (ctx.channel if ctx.guild is None else ctx.author.top_role).id
+        return None
+
+    @staticmethod
+    def _scopes(ctx: commands.Context) -> List[Tuple[str, LimitSpec]]:
+        scopes = []
+        if ctx.cog is not None:
+            spec = getattr(type(ctx.cog), SPEC_ATTR, None)
+            if spec is not None:
+                scopes.append((ctx.cog.qualified_name, spec))
+        spec = getattr(ctx.command.callback, SPEC_ATTR, None)
+        if spec is not None:
+            scopes.append((ctx.command.qualified_name, spec))
+        return scopes
+
+    async def _resolve(self, ctx: commands.Context, name: str, spec: LimitSpec) -> LimitSpec:
+        try:
+            override = await self.config.from_ctx(ctx, 'concurrency', name)
+        except errors.ConfigKeyError:
+            # Outside of guilds there are only global overrides, and no default to fall back on.
+            return spec
+        if not override:
+            return spec
+        return spec._replace(concurrency=override.get('limit', spec.concurrency),
+                             queue=override.get('queue', spec.queue))
+
+    def _limiter(self, name: str, bucket: Any, spec: LimitSpec) -> Limiter:
+        key = (name, bucket)
+        limiter = self._limiters.get(key)
+        if limiter is None or (limiter.concurrency, limiter.queue) != (spec.concurrency, spec.queue):
+            # Holders of a replaced limiter keep a reference to it and release it normally.
+            limiter = self._limiters[key] = Limiter(name, spec.concurrency, spec.queue, key=key)
+        return limiter
+
+    async def acquire(self, ctx: commands.Context):
+        scopes = self._scopes(ctx)
+        if not scopes:
+            return
+        held = getattr(ctx, '_concurrency_permits', None)
+        if held is None:
+            held = ctx._concurrency_permits = {}
+        acquired = []
+        try:
+            for name, spec in scopes:
+                spec = await self._resolve(ctx, name, spec)
+                limiter = self._limiter(name, self._bucket_key(ctx, spec.per), spec)
+                if not await limiter.acquire():
+                    raise errors.CommandBusy(name)
+                acquired.append(limiter)
+        except BaseException:
+            for limiter in acquired:
+                self._release(limiter)
+            raise
+        held[ctx.command] = acquired
+
+    def release(self, ctx: commands.Context):
+        held = getattr(ctx, '_concurrency_permits', None)
+        if not held:
+            return
+        for limiter in held.pop(ctx.command, ()):
+            self._release(limiter)
+
+    def _release(self, limiter: Limiter):
+        limiter.release()
+        if limiter.idle and self._limiters.get(limiter.key) is limiter:
+            del self._limiters[limiter.key]
+
+    def status(self) -> Dict[str, Dict[str, int]]:
+        ret = {}
+        for (name, _), limiter in self._limiters.items():
+            current = ret.setdefault(name, {'active': 0, 'waiting': 0, 'buckets': 0})
+            current['active'] += limiter.active
+            current['waiting'] += limiter.waiting
+            current['buckets'] += 1
+        return ret
+
+
+def limit(concurrency: int, *, queue: int = 0,
+          per: commands.BucketType = commands.BucketType.guild) -> Callable[[_T], _T]:
+    """Limits how many invocations of a command (or of every command in a cog) run at once.
+
+    Up to `queue` further invocations wait for a free slot; anything beyond that
+    fails with :class:`core.errors.CommandBusy`.
+    """
+    spec = LimitSpec(concurrency, queue, per)
+
+    def decorator(obj: _T) -> _T:
+        if isinstance(obj, commands.Command):
+            setattr(obj.callback, SPEC_ATTR, spec)
+        else:
+            setattr(obj, SPEC_ATTR, spec)
+        return obj
+    return decorator
@@ -1,4 +1,6 @@
 import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
 import discord
 from discord.ext import commands
 import json
@@ -6,12 +8,18 @@ import logging
 import os
 from pathlib import Path
 import pickle
-from typing import Any, AsyncContextManager, Awaitable, Dict, Optional, Sequence, Union
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Set, \
+    Tuple, Union
 
 from core import errors
+from core import tracing
 
 __all__ = ["Config"]
 
+ConfigPath = Tuple[str, ...]
+
+_tracked_reads: ContextVar[Optional[Set[ConfigPath]]] = ContextVar('tracked_reads', default=None)
+
 
 class _ValueContextManager(AsyncContextManager, Awaitable):
     def __init__(self, value_obj: "Value", coroutine: Awaitable[Any]):
@@ -166,6 +174,8 @@ class Config(metaclass=_ConfigMeta):
     VOICECHANNEL = 'VOICECHANNEL'
     ROLE = 'ROLE'
 
+    _write_listeners: List[Callable[[ConfigPath], None]] = []
+
     def __init__(self, cog_name: str):
         self.cog_name = cog_name
         self.log = logging.getLogger(cog_name + '.config')
@@ -212,6 +222,9 @@ class Config(metaclass=_ConfigMeta):
         return deepcopy(partial)
 
     async def _get(self, *path: str) -> Any:
+        reads = _tracked_reads.get()
+        if reads is not None:
+            reads.add((self.cog_name, *path))
         partial = self._data
         try:
             for d in path:
@@ -231,6 +244,7 @@ class Config(metaclass=_ConfigMeta):
                 await self._save()
             except AttributeError:
                 raise errors.ConfigIllegalOperation(f'Failed to change {self.cog_name}.{".".join(path)}".')
+        self._notify_write(path)
 
     async def _clear(self, *path: str):
         partial = self._data
@@ -245,10 +259,37 @@ class Config(metaclass=_ConfigMeta):
             except KeyError:
                 return
             await self._save()
+        self._notify_write(path)
+
+    def _notify_write(self, path: Sequence[str]):
+        written = (self.cog_name, *path)
+        for listener in self._write_listeners:
+            listener(written)
+
+    @classmethod
+    def add_write_listener(cls, listener: Callable[[ConfigPath], None]):
+        """Registers a callback that receives ``(cog_name, *path)`` whenever any config value is changed."""
+        cls._write_listeners.append(listener)
+
+    @classmethod
+    def remove_write_listener(cls, listener: Callable[[ConfigPath], None]):
+        cls._write_listeners.remove(listener)
+
+    @staticmethod
+    @contextmanager
+    def track_reads() -> Iterator[Set[ConfigPath]]:
+        """Collects the ``(cog_name, *path)`` of every config value read in the current context."""
+        reads = set()
+        token = _tracked_reads.set(reads)
+        try:
+            yield reads
+        finally:
+            _tracked_reads.reset(token)
 
     async def _save(self):
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, save_json, self._data_path, self._data)
+        with tracing.span('config save', cog=self.cog_name):
+            await loop.run_in_executor(None, save_json, self._data_path, self._data)
 
     @classmethod
     def get_config(cls, cog_name: str = None, cog_instance: commands.Cog = None) -> "Config":
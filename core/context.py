@@ -5,6 +5,10 @@ from discord.ext.commands import Context as DpyContext
 import logging
 from typing import Awaitable, Callable, Optional, Union
 
+from core import tracing
+from core.outbound import DROPPED, Priority
+from core.response_cache import record_send
+
 
 class Context(DpyContext):
     log = logging.getLogger('context')
@@ -27,21 +31,38 @@ class Context(DpyContext):
             if kwargs.pop('no_filter', False) is not True:
                 content = await self.format_content(str(content))
 
-        if 'delete_after' not in kwargs:
-            kwargs['delete_after'] = await self.bot.get_cog('Settings').config.from_ctx(self, 'delete_delay') or None
+        if 'delete_after' in kwargs:
+            delete_after = kwargs.pop('delete_after')
+        else:
+            delete_after = await self.bot.get_cog('Settings').config.from_ctx(self, 'delete_delay') or None
 
-        return await super(Context, self).send(content=content, **kwargs)
+        record_send(content, kwargs)
+        with tracing.span('Context.send'):
+            async with self.bot.outbound.reply():
+                message = await super(Context, self).send(content=content, **kwargs)
+        if delete_after is not None and not self.bot.deletions.schedule(message, delete_after):
+            await message.delete(delay=delete_after)
+        return message
+
+    def can_react(self) -> bool:
+        if not self.guild:
+            return True
+        permissions = self.channel.permissions_for(self.guild.me)
+        return permissions.add_reactions and permissions.read_message_history
 
     async def react(self, reaction: Union[discord.Emoji, discord.Reaction, discord.PartialEmoji, str,
                                           Callable[["Context", str], Awaitable[str]]]) -> bool:
+        """Queues `reaction` to be added to the message without waiting for it. Returns False if it cannot be added here.
+
+        The reaction is cosmetic, so it can still be dropped under load.
+        """
         if callable(reaction):
             reaction = await reaction(self)
-        try:
-            await self.message.add_reaction(reaction)
-        except discord.HTTPException:
+        if not self.can_react():
             return False
-        else:
-            return True
+        self.bot.outbound.schedule(Priority.COSMETIC, lambda: self.message.add_reaction(reaction),
+                                   key=('react', self.message.id, str(reaction)))
+        return True
 
     async def react_or_send(self,
                             reaction: Union[discord.Emoji, discord.Reaction, discord.PartialEmoji, str,
@@ -54,7 +75,12 @@ class Context(DpyContext):
 
     async def safe_delete(self, *, delay: float = 0) -> bool:
         try:
-            await self.message.delete(delay=delay)
+            if delay:
+                await self.message.delete(delay=delay)
+            elif await self.bot.outbound.schedule(Priority.COSMETIC, self.message.delete,
+                                                  key=('delete', self.message.id)) is DROPPED:
+                self.log.debug('Failed to delete message (dropped under load).')
+                return False
         except discord.Forbidden:
             self.log.debug('Failed to delete message (insufficient permissions).')
         except discord.NotFound:
@@ -3,6 +3,8 @@ from discord.ext import commands
 import re
 from typing import Any, Awaitable, Callable, Tuple, Type, TypeVar
 
+from core import tracing
+
 
 __all__ = [
     'DiscordEmojiConverter',
@@ -30,7 +32,8 @@ def get_converter(convert_fn: Callable[[Any, str], Awaitable[_C]]) -> Type[comma
             self.convert_fn = convert_fn
 
         async def convert(self, ctx, argument: str) -> _C:
-            return await self.convert_fn(ctx, argument)
+            with tracing.span('converter', converter=convert_fn.__name__):
+                return await self.convert_fn(ctx, argument)
     return PatbotConverter
 
 
@@ -0,0 +1,130 @@
+import asyncio
+import discord
+from discord.ext import commands
+import logging
+import math
+from typing import Dict, List, Optional
+
+from core import tracing
+from core.metrics import metrics
+from core.outbound import Priority
+
+__all__ = [
+    'DeletionWheel',
+]
+
+log = logging.getLogger('deletion')
+
+BULK_DELETE_LIMIT = 100
+
+
+class DeletionWheel:
+    """Deletes messages after a delay using one hashed timer wheel instead of one sleeping task per message.
+
+    Each of the wheel's `slots` covers `resolution` seconds and holds, per channel, the ids of the
+    messages due in it (plus how many more full turns of the wheel they have to wait). A single
+    task advances the wheel while anything is pending. Messages in the same channel that expire on
+    the same tick are removed with one bulk delete when Patbot is allowed to.
+    """
+
+    def __init__(self, bot: commands.Bot, *, resolution: float = 1.0, slots: int = 1024,
+                 max_pending: int = 100_000):
+        self.bot = bot
+        self.resolution = resolution
+        self.max_pending = max_pending
+        # slot -> channel id -> [[remaining rounds, message id], ...]
+        self._slots: List[Dict[int, List[List[int]]]] = [{} for _ in range(slots)]
+        self._cursor = 0
+        self._pending = 0
+        self._task: Optional[asyncio.Task] = None
+        self._pending_gauge = metrics.gauge('deletion_pending')
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def schedule(self, message: discord.Message, delay: float) -> bool:
+        """Deletes `message` after `delay` seconds. Returns False if the wheel is full."""
+        if self._pending >= self.max_pending:
+            metrics.counter('deletion_overflow_total').inc()
+            return False
+        slots = len(self._slots)
+        ticks = max(1, math.ceil(delay / self.resolution))
+        slot = self._slots[(self._cursor + ticks) % slots]
+        slot.setdefault(message.channel.id, []).append([(ticks - 1) // slots, message.id])
+        self._pending += 1
+        self._pending_gauge.set(self._pending)
+        if self._task is None:
+            self._task = tracing.detached(asyncio.ensure_future, self._run())
+        return True
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _advance(self) -> Dict[int, List[int]]:
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        slot = self._slots[self._cursor]
+        expired = {}
+        for channel_id, entries in list(slot.items()):
+            waiting = []
+            for entry in entries:
+                if entry[0]:
+                    entry[0] -= 1
+                    waiting.append(entry)
+                else:
+                    expired.setdefault(channel_id, []).append(entry[1])
+            if waiting:
+                slot[channel_id] = waiting
+            else:
+                del slot[channel_id]
+        self._pending -= sum(map(len, expired.values()))
+        self._pending_gauge.set(self._pending)
+        return expired
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        next_tick = loop.time()
+        try:
+            while self._pending:
+                next_tick += self.resolution
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+                for channel_id, message_ids in self._advance().items():
+                    self.bot.outbound.schedule(Priority.NORMAL,
+                                               lambda c=channel_id, m=message_ids: self._delete(c, m))
+        finally:
+            self._task = None
+
+    def _can_bulk_delete(self, channel_id: int) -> bool:
+        channel = self.bot.get_channel(channel_id)
+        if not isinstance(channel, discord.TextChannel):
+            return False
+        return channel.permissions_for(channel.guild.me).manage_messages
+
+    async def _delete(self, channel_id: int, message_ids: List[int]):
+        metrics.counter('deletion_messages_total').inc(len(message_ids))
+        if len(message_ids) > 1 and self._can_bulk_delete(channel_id):
+            for i in range(0, len(message_ids), BULK_DELETE_LIMIT):
+                chunk = message_ids[i:i + BULK_DELETE_LIMIT]
+                if len(chunk) == 1:
+                    await self._delete_one(channel_id, chunk[0])
+                    continue
+                try:
+                    await self.bot.http.delete_messages(channel_id, chunk)
+                except discord.HTTPException as e:
+                    log.debug(f'Bulk delete in {channel_id} failed ({e}); deleting one at a time.')
+                    for message_id in chunk:
+                        await self._delete_one(channel_id, message_id)
+                else:
+                    metrics.counter('deletion_bulk_requests_total').inc()
+        else:
+            for message_id in message_ids:
+                await self._delete_one(channel_id, message_id)
+
+    async def _delete_one(self, channel_id: int, message_id: int):
+        metrics.counter('deletion_single_requests_total').inc()
+        try:
+            await self.bot.http.delete_message(channel_id, message_id)
+        except discord.HTTPException as e:
+            log.debug(f'Failed to delete message {message_id} in {channel_id} ({e}).')
@@ -16,6 +16,12 @@ class CogUnloadFailure(PatbotCommandError):
         super(CogUnloadFailure, self).__init__(f'The cog "{name}" failed to unload properly.')
 
 
+class CommandBusy(PatbotCommandError):
+    def __init__(self, scope: str):
+        self.scope = scope
+        super(CommandBusy, self).__init__(f'Too many "{scope}" commands are running right now.')
+
+
 class ConfigError(PatbotError):
     pass
 
@@ -1,2 +1,3 @@
+from core.menus.scheduled import ScheduledMenu
 from core.menus.confirm import Confirm
 from core.menus.choice import SingleChoice
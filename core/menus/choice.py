@@ -1,8 +1,10 @@
 import discord
 from discord.ext import menus
 
+from core.menus.scheduled import ScheduledMenu
 
-class SingleChoice(menus.Menu):
+
+class SingleChoice(ScheduledMenu):
     def __init__(self, choices: list, content: str, delete_message_after: bool = True, message: discord.Message = None):
         super(SingleChoice, self).__init__(timeout=60.0, delete_message_after=delete_message_after,
                                            clear_reactions_after=True)
@@ -1,7 +1,9 @@
 from discord.ext import menus
 
+from core.menus.scheduled import ScheduledMenu
 
-class Confirm(menus.Menu):
+
+class Confirm(ScheduledMenu):
     """
     A menu used for confirm/deny decisions that
     require verification.
@@ -19,7 +21,7 @@ class Confirm(menus.Menu):
     """
 
     def __init__(self, content: str, delete_message_after=True):
-        super().__init__(timeout=30.0, delete_message_after=delete_message_after)
+        super(Confirm, self).__init__(timeout=30.0, delete_message_after=delete_message_after)
         self.content = content
         self.result = None
 
@@ -0,0 +1,36 @@
+from discord.ext import menus
+import time
+from typing import Optional
+
+from core.scheduler import ScheduledJob
+
+
+class ScheduledMenu(menus.Menu):
+    """A menu whose timeout is a job on the bot's scheduler instead of a timer in its reaction loop.
+
+    As with a regular menu, the timeout restarts whenever a button is pressed.
+    """
+
+    def __init__(self, *, timeout: float = 180.0, **kwargs):
+        super(ScheduledMenu, self).__init__(timeout=None, **kwargs)
+        self.idle_timeout = timeout
+        self._deadline_job: Optional[ScheduledJob] = None
+
+    async def start(self, ctx, *, channel=None, wait=False):
+        self._cancel_deadline()
+        self._deadline_job = ctx.bot.scheduler.call_later(self.idle_timeout, self.stop)
+        await super(ScheduledMenu, self).start(ctx, channel=channel, wait=wait)
+
+    async def update(self, payload):
+        await super(ScheduledMenu, self).update(payload)
+        if self._deadline_job is not None and not self._deadline_job.cancelled:
+            self._deadline_job = self.bot.scheduler.reschedule(self._deadline_job, time.time() + self.idle_timeout)
+
+    def _cancel_deadline(self):
+        if self._deadline_job is not None:
+            self._deadline_job.cancel()
+            self._deadline_job = None
+
+    def stop(self):
+        self._cancel_deadline()
+        super(ScheduledMenu, self).stop()
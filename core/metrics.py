@@ -0,0 +1,135 @@
+from contextlib import contextmanager
+import time
+from typing import Dict, Iterator, Tuple, Union
+
+__all__ = [
+    'Counter',
+    'Gauge',
+    'Timer',
+    'Metrics',
+    'metrics',
+]
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: Union[int, float] = 1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: Union[int, float]):
+        self.value = value
+
+    def inc(self, amount: Union[int, float] = 1):
+        self.value += amount
+
+    def dec(self, amount: Union[int, float] = 1):
+        self.value -= amount
+
+
+class Timer:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Metrics:
+    """A process-wide registry of named counters, gauges and timers.
+
+    Metrics are identified by a name and an optional set of string labels, e.g.
+    ``metrics.counter('commands_total', command='spell').inc()``.
+    """
+
+    def __init__(self):
+        self._counters: Dict[_Key, Counter] = {}
+        self._gauges: Dict[_Key, Gauge] = {}
+        self._timers: Dict[_Key, Timer] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, object]) -> _Key:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def counter(self, name: str, **labels) -> Counter:
+        key = self._key(name, labels)
+        try:
+            return self._counters[key]
+        except KeyError:
+            return self._counters.setdefault(key, Counter())
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        key = self._key(name, labels)
+        try:
+            return self._gauges[key]
+        except KeyError:
+            return self._gauges.setdefault(key, Gauge())
+
+    def timer(self, name: str, **labels) -> Timer:
+        key = self._key(name, labels)
+        try:
+            return self._timers[key]
+        except KeyError:
+            return self._timers.setdefault(key, Timer())
+
+    def clear(self):
+        self._counters.clear()
+        self._gauges.clear()
+        self._timers.clear()
+
+    @staticmethod
+    def _format_key(key: _Key, suffix: str = '') -> str:
+        name, labels = key
+        if not labels:
+            return name + suffix
+        return name + suffix + '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+    def export(self, prefix: str = '') -> str:
+        """Renders every metric whose name starts with `prefix` in a Prometheus-like text format."""
+        lines = []
+        for key, counter in sorted(self._counters.items()):
+            if key[0].startswith(prefix):
+                lines.append(f'{self._format_key(key)} {counter.value}')
+        for key, gauge in sorted(self._gauges.items()):
+            if key[0].startswith(prefix):
+                lines.append(f'{self._format_key(key)} {gauge.value}')
+        for key, timer in sorted(self._timers.items()):
+            if key[0].startswith(prefix):
+                lines.append(f'{self._format_key(key, "_count")} {timer.count}')
+                lines.append(f'{self._format_key(key, "_sum")} {timer.total:.6f}')
+                lines.append(f'{self._format_key(key, "_max")} {timer.max:.6f}')
+        return '\n'.join(lines)
+
+
+metrics = Metrics()
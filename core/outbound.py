@@ -0,0 +1,208 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import enum
+import logging
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from core import tracing
+from core.metrics import metrics
+
+__all__ = [
+    'Priority',
+    'DROPPED',
+    'OutboundScheduler',
+]
+
+log = logging.getLogger('outbound')
+
+
+class Priority(enum.IntEnum):
+    # User-visible replies: sent right away, never queued.
+    REPLY = 0
+    # Background work that should not wait on replies, but goes after them.
+    NORMAL = 1
+    # Reactions, cleanup and pins: deferred while replies are in flight, coalesced and droppable.
+    COSMETIC = 2
+
+
+class _Dropped:
+    def __repr__(self) -> str:
+        return 'DROPPED'
+
+    def __bool__(self) -> bool:
+        return False
+
+
+DROPPED = _Dropped()
+
+
+class _Job:
+    __slots__ = ('priority', 'factory', 'key', 'future', 'enqueued')
+
+    def __init__(self, priority: Priority, factory: Callable[[], Awaitable[Any]], key: Optional[Hashable],
+                 future: asyncio.Future, enqueued: float):
+        self.priority = priority
+        self.factory = factory
+        self.key = key
+        self.future = future
+        self.enqueued = enqueued
+
+
+class OutboundScheduler:
+    """Orders outgoing Discord requests so replies are never stuck behind side effects.
+
+    Replies run immediately inside :meth:`reply`. Everything else is queued by priority and run by
+    a few worker tasks. Cosmetic jobs stay queued (up to `max_defer` seconds) while any reply is in
+    flight, without holding up a worker, jobs with the same key are coalesced while queued, and
+    cosmetic jobs that are older than `max_age` or that overflow `max_queued` are dropped. Dropped
+    jobs resolve to :data:`DROPPED`. Anything that must not be dropped is scheduled as normal.
+    """
+
+    def __init__(self, *, workers: int = 2, max_defer: float = 2.0, max_queued: int = 256, max_age: float = 30.0):
+        self.workers = workers
+        self.max_defer = max_defer
+        self.max_queued = max_queued
+        self.max_age = max_age
+        self._queues: Dict[Priority, Deque[_Job]] = {p: deque() for p in Priority if p is not Priority.REPLY}
+        self._pending: Dict[Hashable, _Job] = {}
+        self._replies = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._in_flight = metrics.gauge('outbound_replies_in_flight')
+
+    @property
+    def replies_in_flight(self) -> int:
+        return self._replies
+
+    def queued(self, priority: Priority = None) -> int:
+        if priority is None:
+            return sum(map(len, self._queues.values()))
+        return len(self._queues[priority])
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [tracing.detached(asyncio.ensure_future, self._worker()) for _ in range(self.workers)]
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for queue in self._queues.values():
+            while queue:
+                self._drop(queue.popleft(), 'closed')
+
+    @asynccontextmanager
+    async def reply(self):
+        """Marks a user-visible request as in flight for as long as the block runs."""
+        self._ensure_started()
+        self._replies += 1
+        self._in_flight.set(self._replies)
+        try:
+            yield
+        finally:
+            self._replies -= 1
+            self._in_flight.set(self._replies)
+            if not self._replies:
+                # Deferred cosmetic jobs can run now.
+                self._wakeup.set()
+
+    def schedule(self, priority: Priority, factory: Callable[[], Awaitable[Any]], *,
+                 key: Hashable = None) -> asyncio.Future:
+        """Queues ``factory()`` to be awaited later and returns a future for its result.
+
+        The future resolves to :data:`DROPPED` if the job is dropped. Nobody has to await it.
+        """
+        self._ensure_started()
+        loop = asyncio.get_event_loop()
+        if priority is Priority.REPLY:
+            future = asyncio.ensure_future(self._run_reply(factory))
+            future.add_done_callback(self._consume)
+            return future
+        if key is not None:
+            existing = self._pending.get(key)
+            if existing is not None:
+                metrics.counter('outbound_coalesced_total', priority=priority.name).inc()
+                return existing.future
+
+        future = loop.create_future()
+        future.add_done_callback(self._consume)
+        job = _Job(priority, factory, key, future, loop.time())
+        queue = self._queues[priority]
+        queue.append(job)
+        if key is not None:
+            self._pending[key] = job
+        if priority is Priority.COSMETIC and len(queue) > self.max_queued:
+            self._drop(queue.popleft(), 'overflow')
+        metrics.gauge('outbound_queued', priority=priority.name).set(len(queue))
+        self._wakeup.set()
+        return future
+
+    async def _run_reply(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        metrics.timer('outbound_queue_delay_seconds', priority=Priority.REPLY.name).observe(0.0)
+        async with self.reply():
+            return await factory()
+
+    @staticmethod
+    def _consume(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            log.debug(f'Outbound job failed: {future.exception()!r}')
+
+    def _drop(self, job: _Job, reason: str):
+        if job.key is not None and self._pending.get(job.key) is job:
+            del self._pending[job.key]
+        if not job.future.done():
+            job.future.set_result(DROPPED)
+        metrics.counter('outbound_dropped_total', priority=job.priority.name, reason=reason).inc()
+
+    def _deferred(self, now: float) -> Optional[float]:
+        """How long the cosmetic jobs are deferred for, if they are."""
+        queue = self._queues[Priority.COSMETIC]
+        if not queue or not self._replies:
+            return None
+        remaining = queue[0].enqueued + self.max_defer - now
+        return remaining if remaining > 0 else None
+
+    def _pop(self, now: float) -> Optional[_Job]:
+        for priority, queue in self._queues.items():
+            if priority is Priority.COSMETIC and self._deferred(now) is not None:
+                # The oldest cosmetic job is deferred the longest, so every other one is too.
+                break
+            if queue:
+                job = queue.popleft()
+                metrics.gauge('outbound_queued', priority=priority.name).set(len(queue))
+                if job.key is not None and self._pending.get(job.key) is job:
+                    del self._pending[job.key]
+                return job
+        return None
+
+    async def _worker(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            job = self._pop(loop.time())
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    # Woken up by new jobs or the last reply finishing, or when the deferral runs out.
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._deferred(loop.time()))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if job.priority is Priority.COSMETIC and loop.time() - job.enqueued > self.max_age:
+                self._drop(job, 'stale')
+                continue
+            if job.future.done():
+                continue
+            metrics.timer('outbound_queue_delay_seconds', priority=job.priority.name).observe(
+                loop.time() - job.enqueued)
+            try:
+                result = await job.factory()
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
@@ -4,6 +4,7 @@ from discord.ext.commands import Context
 import enum
 from typing import Awaitable, Callable, Optional, Union
 from core.config import Config
+from core import tracing
 
 
 CheckPredicate = Callable[[Context], Union[Optional[bool], Awaitable[Optional[bool]]]]
@@ -31,6 +32,11 @@ class PermissionsLevel(enum.IntEnum):
 
     @classmethod
     async def from_ctx(cls, ctx: Context) -> "PermissionsLevel":
+        with tracing.span('PermissionsLevel.from_ctx'):
+            return await cls._from_ctx(ctx)
+
+    @classmethod
+    async def _from_ctx(cls, ctx: Context) -> "PermissionsLevel":
         if ctx.author.id == await ctx.bot.config.creator_id():
             return cls.BOT_CREATOR
         if await ctx.bot.is_owner(ctx.author):
@@ -97,61 +103,68 @@ def author_has_all_roles(ctx: Context, *roles: str) -> bool:
     return user_has_all_roles(ctx.author, *roles)
 
 
+def _check(name: str, predicate: CheckPredicate) -> CheckPredicate:
+    async def traced(ctx: Context) -> bool:
+        with tracing.span(f'check {name}'):
+            return await discord.utils.maybe_coroutine(predicate, ctx)
+    return commands.check(traced)
+
+
 def meme_team() -> CheckPredicate:
     def predicate(ctx: Context) -> bool:
         return ctx.guild.id == 300755943912636417
-    return commands.check(predicate)
+    return _check('meme_team', predicate)
 
 
 def creator() -> CheckPredicate:
     async def predicate(ctx: Context) -> bool:
         return ctx.author.id == int(await ctx.bot.config.creator_id())
-    return commands.check(predicate)
+    return _check('creator', predicate)
 
 
 def owner() -> CheckPredicate:
     def predicate(ctx: Context) -> bool:
         return ctx.bot.is_owner(ctx.author)
-    return commands.check(predicate)
+    return _check('owner', predicate)
 
 
 def guildowner() -> CheckPredicate:
     async def predicate(ctx: Context) -> bool:
         return ctx.guild and await PermissionsLevel.from_ctx(ctx) >= PermissionsLevel.GUILD_OWNER
-    return commands.check(predicate)
+    return _check('guildowner', predicate)
 
 
 def guildowner_or_permissions(**perms) -> CheckPredicate:
     async def predicate(ctx: Context) -> bool:
         return ctx.guild and (await PermissionsLevel.from_ctx(ctx) >= PermissionsLevel.GUILD_OWNER
                               or author_has_permissions(ctx, **perms))
-    return commands.check(predicate)
+    return _check('guildowner_or_permissions', predicate)
 
 
 def admin() -> CheckPredicate:
     async def predicate(ctx: Context) -> bool:
         return await PermissionsLevel.from_ctx(ctx) >= PermissionsLevel.ADMIN
-    return commands.check(predicate)
+    return _check('admin', predicate)
 
 
 def admin_or_permissions(**perms) -> CheckPredicate:
     async def predicate(ctx: Context) -> bool:
         return await PermissionsLevel.from_ctx(ctx) >= PermissionsLevel.ADMIN or \
             author_has_permissions(ctx, **perms)
-    return commands.check(predicate)
+    return _check('admin_or_permissions', predicate)
 
 
 def mod() -> CheckPredicate:
     async def predicate(ctx: Context) -> bool:
         return await PermissionsLevel.from_ctx(ctx) >= PermissionsLevel.MOD
-    return commands.check(predicate)
+    return _check('mod', predicate)
 
 
 def mod_or_permissions(**perms) -> CheckPredicate:
     async def predicate(ctx: Context) -> bool:
         return await PermissionsLevel.from_ctx(ctx) >= PermissionsLevel.MOD or \
             author_has_permissions(ctx, **perms)
-    return commands.check(predicate)
+    return _check('mod_or_permissions', predicate)
 
 
 def missing_permissions(required: discord.Permissions, actual: discord.Permissions):
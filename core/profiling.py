@@ -0,0 +1,89 @@
+from collections import Counter
+import os
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+
+__all__ = [
+    'StackSampler',
+]
+
+
+class StackSampler:
+    """A statistical profiler that periodically samples one thread's stack from a background thread.
+
+    The result is in the "collapsed stack" format used by flamegraph tools: one line per
+    unique stack, frames separated by semicolons from the outermost inward, followed by
+    the number of samples it was seen in.
+    """
+
+    def __init__(self, thread_id: int = None, *, rate: float = 100.0, max_depth: int = 128):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = 1.0 / max(1.0, rate)
+        self.max_depth = max_depth
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._counts: Counter = Counter()
+        self._labels: Dict[Tuple[str, str, int], str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._root = os.getcwd() + os.sep
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            raise RuntimeError('The sampler is already running.')
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self.stopped_at = None
+        self._thread = threading.Thread(target=self._run, name='patbot-stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.stopped_at = time.monotonic()
+
+    def _label(self, frame: FrameType) -> str:
+        code = frame.f_code
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        label = self._labels.get(key)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(self._root):
+                filename = filename[len(self._root):]
+            label = self._labels[key] = f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+        return label
+
+    def _run(self):
+        interval = self.interval
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            del frame
+            stack.reverse()
+            self._counts[';'.join(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self._counts.most_common())
+
+    def top(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Counts how many samples each function was the innermost (self-time) frame of."""
+        leaves = Counter()
+        for stack, count in self._counts.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(limit)
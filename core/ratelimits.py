@@ -0,0 +1,154 @@
+from collections import deque, OrderedDict
+import discord
+from discord.http import HTTPClient, Route
+import logging
+import time
+from typing import Deque, List, Optional
+
+from core.metrics import metrics
+
+__all__ = [
+    'BucketStats',
+    'RateLimitTelemetry',
+]
+
+_RATE_LIMITED_MSG = 'We are being rate limited.'
+_GLOBAL_RATE_LIMITED_MSG = 'Global rate limit has been hit.'
+
+
+class BucketStats:
+    __slots__ = ('bucket', 'requests', 'errors', 'rate_limited', 'retry_after', 'latency', 'max_latency', '_recent')
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.retry_after = 0.0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self._recent: Deque[float] = deque(maxlen=1024)
+
+    @property
+    def route(self) -> str:
+        return self.bucket.split(':', 2)[-1]
+
+    @property
+    def mean_latency(self) -> float:
+        return self.latency / self.requests if self.requests else 0.0
+
+    def per_minute(self, now: float = None) -> int:
+        """How many requests were made under this bucket in the last minute."""
+        now = time.monotonic() if now is None else now
+        recent = self._recent
+        while recent and recent[0] < now - 60.0:
+            recent.popleft()
+        return len(recent)
+
+
+class _RateLimitLogHandler(logging.Handler):
+    """discord.py only reports 429s through its logger, so listen there."""
+
+    def __init__(self, telemetry: "RateLimitTelemetry"):
+        super(_RateLimitLogHandler, self).__init__(level=logging.WARNING)
+        self.telemetry = telemetry
+
+    def emit(self, record: logging.LogRecord):
+        msg = record.msg
+        if not isinstance(msg, str):
+            return
+        if msg.startswith(_RATE_LIMITED_MSG) and len(record.args) == 2:
+            retry_after, bucket = record.args
+            self.telemetry.on_rate_limited(str(bucket), float(retry_after))
+        elif msg.startswith(_GLOBAL_RATE_LIMITED_MSG):
+            self.telemetry.on_global_rate_limited()
+
+
+class RateLimitTelemetry:
+    """Records request counts, latency, errors and 429s for each of discord.py's REST buckets.
+
+    A bucket is discord.py's unit of rate limiting: the route's path plus its channel and guild.
+    Per-bucket detail is kept for the `max_buckets` most recently used buckets; the exported
+    metrics are aggregated per route so they stay bounded.
+    """
+
+    def __init__(self, max_buckets: int = 512):
+        self.max_buckets = max_buckets
+        self.global_rate_limited = 0
+        self._buckets: "OrderedDict[str, BucketStats]" = OrderedDict()
+        self._handler = _RateLimitLogHandler(self)
+        self._http: Optional[HTTPClient] = None
+        self._original_request = None
+
+    def install(self, http: HTTPClient):
+        if self._http is not None:
+            raise RuntimeError('Telemetry is already installed.')
+        original = http.request
+
+        async def request(route: Route, **kwargs):
+            start = time.perf_counter()
+            status = None
+            try:
+                return await original(route, **kwargs)
+            except discord.HTTPException as e:
+                status = e.status
+                raise
+            except Exception:
+                status = 'error'
+                raise
+            finally:
+                self.on_request(route, status, time.perf_counter() - start)
+
+        http.request = request
+        self._http = http
+        self._original_request = original
+        logging.getLogger('discord.http').addHandler(self._handler)
+
+    def uninstall(self):
+        if self._http is None:
+            return
+        self._http.request = self._original_request
+        self._http = self._original_request = None
+        logging.getLogger('discord.http').removeHandler(self._handler)
+
+    def _stats(self, bucket: str) -> BucketStats:
+        stats = self._buckets.get(bucket)
+        if stats is None:
+            stats = self._buckets[bucket] = BucketStats(bucket)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(bucket)
+        return stats
+
+    def on_request(self, route: Route, status, elapsed: float):
+        stats = self._stats(route.bucket)
+        stats.requests += 1
+        stats.latency += elapsed
+        stats.max_latency = max(stats.max_latency, elapsed)
+        stats._recent.append(time.monotonic())
+        name = f'{route.method} {route.path}'
+        metrics.counter('discord_http_requests_total', route=name).inc()
+        metrics.timer('discord_http_request_seconds', route=name).observe(elapsed)
+        if status is not None:
+            stats.errors += 1
+            metrics.counter('discord_http_errors_total', route=name, status=status).inc()
+
+    def on_rate_limited(self, bucket: str, retry_after: float):
+        stats = self._stats(bucket)
+        stats.rate_limited += 1
+        stats.retry_after += retry_after
+        metrics.counter('discord_http_429_total', path=stats.route).inc()
+        metrics.counter('discord_http_retry_after_seconds_total', path=stats.route).inc(retry_after)
+
+    def on_global_rate_limited(self):
+        self.global_rate_limited += 1
+        metrics.counter('discord_http_global_429_total').inc()
+
+    def busiest(self, limit: int = 10) -> List[BucketStats]:
+        now = time.monotonic()
+        return sorted(self._buckets.values(), key=lambda s: (-s.per_minute(now), -s.rate_limited))[:limit]
+
+    def rate_limited(self, limit: int = 10) -> List[BucketStats]:
+        return sorted((s for s in self._buckets.values() if s.rate_limited),
+                      key=lambda s: -s.retry_after)[:limit]
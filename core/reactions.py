@@ -0,0 +1,106 @@
+import asyncio
+import discord
+import inspect
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+from core.metrics import metrics
+
+__all__ = [
+    'ReactionRouter',
+    'seed_reactions',
+]
+
+log = logging.getLogger('reactions')
+
+ReactionHandler = Callable[[discord.RawReactionActionEvent], Any]
+
+
+class ReactionRouter:
+    """Hands raw reaction events to the handlers subscribed to the message they were made on.
+
+    Waiting with ``bot.wait_for`` makes every waiter's check run for every reaction the bot sees,
+    so each reaction costs O(waiters). Here subscriptions are indexed by message id and dispatching
+    an event is a single dict lookup, however many messages are being watched.
+
+    Handlers are called with the :class:`discord.RawReactionActionEvent`; if they return an
+    awaitable it is run in a new task.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[int, List[ReactionHandler]] = {}
+        self._subscriptions = metrics.gauge('reaction_subscriptions')
+        self._events = metrics.counter('reaction_events_total')
+        self._routed = metrics.counter('reaction_events_routed_total')
+
+    def __len__(self) -> int:
+        return len(self._handlers)
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._handlers
+
+    def subscribe(self, message_id: int, handler: ReactionHandler):
+        self._handlers.setdefault(message_id, []).append(handler)
+        self._subscriptions.set(len(self._handlers))
+
+    def unsubscribe(self, message_id: int, handler: ReactionHandler = None):
+        """Removes `handler` from `message_id`, or every handler on it if `handler` is None."""
+        handlers = self._handlers.get(message_id)
+        if handlers is None:
+            return
+        if handler is not None:
+            try:
+                handlers.remove(handler)
+            except ValueError:
+                pass
+        if handler is None or not handlers:
+            del self._handlers[message_id]
+        self._subscriptions.set(len(self._handlers))
+
+    def dispatch(self, payload: discord.RawReactionActionEvent) -> bool:
+        """Runs the handlers subscribed to the payload's message. Returns whether there were any."""
+        self._events.inc()
+        handlers = self._handlers.get(payload.message_id)
+        if not handlers:
+            return False
+        self._routed.inc()
+        for handler in tuple(handlers):
+            try:
+                result = handler(payload)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result).add_done_callback(_log_failure)
+            except Exception:
+                log.exception(f'Reaction handler for message {payload.message_id} failed.')
+        return True
+
+
+def _log_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        log.error('Reaction task failed.', exc_info=task.exception())
+
+
+def seed_reactions(message: discord.Message, emojis: Iterable, *, kind: str = 'other') -> asyncio.Task:
+    """Adds `emojis` to `message` in a background task and returns the task; cancel it to stop early.
+
+    Discord orders reactions by when they were first added and discord.py sends requests for one
+    bucket one at a time, so the reactions still go out in sequence. The point is that whatever
+    the message is for can start taking input right away instead of after the last one.
+    Reactions the bot has already added are skipped.
+    """
+    existing = {str(reaction.emoji) for reaction in message.reactions if reaction.me}
+    pending = [emoji for emoji in emojis if str(emoji) not in existing]
+
+    async def seed():
+        start = time.perf_counter()
+        try:
+            for emoji in pending:
+                await message.add_reaction(emoji)
+        except (discord.NotFound, discord.Forbidden) as e:
+            log.debug(f'Stopped adding reactions to {message.id}: {e}')
+            return
+        metrics.timer('reaction_seed_seconds', kind=kind).observe(time.perf_counter() - start)
+
+    task = asyncio.ensure_future(seed())
+    task.add_done_callback(_log_failure)
+    return task
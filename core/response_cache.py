@@ -0,0 +1,181 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+import discord
+from discord.ext import commands
+import functools
+import time
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Set, Tuple, TypeVar
+
+from core.config import Config, ConfigPath
+from core.metrics import metrics
+
+__all__ = [
+    'ResponseCache',
+    'cached_response',
+]
+
+_T = TypeVar('_T')
+
+_recording: ContextVar[Optional["_Recorder"]] = ContextVar('response_recording', default=None)
+
+
+class _Entry(NamedTuple):
+    content: Optional[str]
+    embed: Optional[discord.Embed]
+    reads: Set[ConfigPath]
+    expires: float
+
+
+class _Recorder:
+    __slots__ = ('content', 'embed', 'sends', 'cacheable')
+
+    def __init__(self):
+        self.content = None
+        self.embed = None
+        self.sends = 0
+        self.cacheable = True
+
+    def record(self, content: Optional[str], kwargs: Dict[str, Any]):
+        self.sends += 1
+        if self.sends > 1 or kwargs.get('file') or kwargs.get('files'):
+            self.cacheable = False
+            return
+        self.content = content
+        embed = kwargs.get('embed')
+        self.embed = embed.copy() if embed is not None else None
+
+
+def record_send(content: Optional[str], kwargs: Dict[str, Any]):
+    """Called by :meth:`core.Context.send` so a cached command's reply can be stored."""
+    recorder = _recording.get()
+    if recorder is not None:
+        recorder.record(content, kwargs)
+
+
+class ResponseCache:
+    """Stores the single reply of idempotent commands.
+
+    Entries are keyed by (command, guild, channel permissions class, arguments) and are
+    dropped when any config value they read is changed, when they expire, or when the
+    cache is full and they are the least recently used.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        # (cog_name, category) -> keys of entries that read something under it
+        self._dependents: Dict[Tuple[str, str], Set[Hashable]] = {}
+        self._size = metrics.gauge('response_cache_entries')
+        self._invalidations = metrics.counter('response_cache_invalidations_total')
+        Config.add_write_listener(self.invalidate)
+
+    def close(self):
+        Config.remove_write_listener(self.invalidate)
+        self.clear()
+
+    def clear(self):
+        self._entries.clear()
+        self._dependents.clear()
+        self._size.set(0)
+
+    @staticmethod
+    def _permissions_class(ctx: commands.Context) -> int:
+        if ctx.guild is None:
+            return -1
+        permissions = ctx.channel.permissions_for(ctx.me)
+        return (permissions.embed_links << 1) | permissions.external_emojis
+
+    def _key(self, ctx: commands.Context, args: tuple, kwargs: Dict[str, Any]) -> Hashable:
+        args = args[2:] if ctx.cog is not None else args[1:]
+        return (
+            ctx.command.qualified_name,
+            ctx.guild.id if ctx.guild is not None else None,
+            self._permissions_class(ctx),
+            tuple(map(repr, args)),
+            tuple(sorted((k, repr(v)) for k, v in kwargs.items())),
+        )
+
+    def _store(self, key: Hashable, entry: _Entry):
+        self._drop(key)
+        self._entries[key] = entry
+        for path in entry.reads:
+            self._dependents.setdefault(path[:2], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+        self._size.set(len(self._entries))
+
+    def _drop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for path in entry.reads:
+            dependents = self._dependents.get(path[:2])
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._dependents[path[:2]]
+
+    def invalidate(self, written: ConfigPath):
+        keys = self._dependents.get(written[:2])
+        if not keys:
+            return
+        stale = []
+        for key in keys:
+            for read in self._entries[key].reads:
+                shortest = min(len(read), len(written))
+                if read[:shortest] == written[:shortest]:
+                    stale.append(key)
+                    break
+        for key in stale:
+            self._drop(key)
+        self._invalidations.inc(len(stale))
+        self._size.set(len(self._entries))
+
+    async def invoke(self, ctx: commands.Context, func: Callable, args: tuple, kwargs: Dict[str, Any],
+                     ttl: float) -> Any:
+        key = self._key(ctx, args, kwargs)
+        name = ctx.command.qualified_name
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                metrics.counter('response_cache_hits_total', command=name).inc()
+                send_kwargs = {'embed': entry.embed.copy() if entry.embed is not None else None}
+                if entry.content is not None:
+                    send_kwargs.update(content=entry.content, no_filter=True)
+                return await ctx.send(**send_kwargs)
+            self._drop(key)
+        metrics.counter('response_cache_misses_total', command=name).inc()
+
+        recorder = _Recorder()
+        token = _recording.set(recorder)
+        try:
+            with Config.track_reads() as reads:
+                result = await func(*args, **kwargs)
+        finally:
+            _recording.reset(token)
+        if recorder.cacheable and recorder.sends == 1:
+            self._store(key, _Entry(recorder.content, recorder.embed, reads, time.monotonic() + ttl))
+        return result
+
+
+def cached_response(*, ttl: float = 300.0) -> Callable[[_T], _T]:
+    """Caches a command's reply in the bot's :class:`ResponseCache`.
+
+    Only use this on commands whose reply depends solely on their arguments, the guild,
+    and config values, and which send exactly one message without attachments.
+    `ttl` bounds how stale anything else shown in the reply (e.g. guild roles) may get.
+    """
+    def decorator(obj: _T) -> _T:
+        func = obj.callback if isinstance(obj, commands.Command) else obj
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            ctx = args[1] if isinstance(args[0], commands.Cog) else args[0]
+            return await ctx.bot.response_cache.invoke(ctx, func, args, kwargs, ttl)
+
+        if isinstance(obj, commands.Command):
+            obj.callback = wrapper
+            return obj
+        return wrapper
+    return decorator
@@ -0,0 +1,227 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import uuid
+
+from core import tracing
+from core.config import Config
+from core.metrics import metrics
+
+__all__ = [
+    'ScheduledJob',
+    'Scheduler',
+]
+
+log = logging.getLogger('scheduler')
+
+PersistentHandler = Callable[["ScheduledJob"], Awaitable[None]]
+
+
+class ScheduledJob:
+    __slots__ = ('id', 'when', 'callback', 'args', 'kind', 'payload', 'cancelled', '_scheduler')
+
+    def __init__(self, scheduler: "Scheduler", when: float, callback: Optional[Callable], args: tuple,
+                 kind: Optional[str] = None, payload: Optional[Dict[str, Any]] = None, job_id: str = None):
+        self._scheduler = scheduler
+        self.id = job_id or uuid.uuid4().hex
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.kind = kind
+        self.payload = payload
+        self.cancelled = False
+
+    @property
+    def persistent(self) -> bool:
+        return self.kind is not None
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.when - time.time())
+
+    def cancel(self):
+        self._scheduler.cancel(self)
+
+    def __repr__(self) -> str:
+        return f'<ScheduledJob id={self.id} kind={self.kind} when={self.when:.0f} cancelled={self.cancelled}>'
+
+
+class Scheduler:
+    """Runs every deadline in the bot from one heap and one task.
+
+    Jobs are kept in a binary heap ordered by their (wall clock) deadline, so adding,
+    cancelling and rescheduling are all O(log n); cancelled jobs are skipped lazily and
+    the heap is compacted once they make up most of it.
+
+    Persistent jobs have a `kind` and a JSON-serializable `payload` instead of a callback.
+    They are saved to the core config and reloaded by :meth:`load`, and run through the
+    handler registered for their kind once one is registered (e.g. when its cog loads).
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self._heap: List[Tuple[float, int, ScheduledJob]] = []
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._handlers: Dict[str, PersistentHandler] = {}
+        self._orphans: Dict[str, List[ScheduledJob]] = {}
+        self._persistent: Dict[str, ScheduledJob] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._save_task: Optional[asyncio.Task] = None
+        # Whether the persistent jobs changed since they were last written.
+        self._dirty = False
+        self._size = metrics.gauge('scheduler_jobs')
+
+    def __len__(self) -> int:
+        return len(self._heap) - self._cancelled
+
+    def start(self):
+        if self._task is None:
+            self._changed = asyncio.Event()
+            self._task = tracing.detached(asyncio.ensure_future, self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _push(self, job: ScheduledJob) -> ScheduledJob:
+        was_first = not self._heap or job.when < self._heap[0][0]
+        heapq.heappush(self._heap, (job.when, next(self._counter), job))
+        self._size.set(len(self))
+        self.start()
+        if was_first:
+            self._changed.set()
+        return job
+
+    def call_at(self, when: float, callback: Callable, *args) -> ScheduledJob:
+        """Calls `callback(*args)` at the unix timestamp `when`. Coroutine functions are awaited in a new task."""
+        return self._push(ScheduledJob(self, when, callback, args))
+
+    def call_later(self, delay: float, callback: Callable, *args) -> ScheduledJob:
+        return self.call_at(time.time() + delay, callback, *args)
+
+    def schedule_persistent(self, kind: str, when: float, payload: Dict[str, Any] = None, *,
+                            job_id: str = None) -> ScheduledJob:
+        """Schedules a job that survives restarts; it is run by the handler registered for `kind`."""
+        existing = self._persistent.get(job_id) if job_id is not None else None
+        if existing is not None:
+            self.cancel(existing)
+        job = ScheduledJob(self, when, None, (), kind, payload or {}, job_id)
+        self._persistent[job.id] = job
+        self._save_later()
+        return self._push(job)
+
+    def get_persistent(self, job_id: str) -> Optional[ScheduledJob]:
+        return self._persistent.get(job_id)
+
+    def cancel(self, job: ScheduledJob):
+        if job.cancelled:
+            return
+        job.cancelled = True
+        orphans = self._orphans.get(job.kind) if job.persistent else None
+        if orphans and job in orphans:
+            orphans.remove(job)
+        else:
+            self._cancelled += 1
+        if job.persistent and self._persistent.get(job.id) is job:
+            del self._persistent[job.id]
+            self._save_later()
+        if self._cancelled > 64 and self._cancelled > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        self._size.set(len(self))
+
+    def reschedule(self, job: ScheduledJob, when: float) -> ScheduledJob:
+        """Moves a job to a new deadline. Returns the job that replaces it."""
+        self.cancel(job)
+        if job.persistent:
+            return self.schedule_persistent(job.kind, when, job.payload, job_id=job.id)
+        return self.call_at(when, job.callback, *job.args)
+
+    def register(self, kind: str, handler: PersistentHandler):
+        """Sets the coroutine that runs persistent jobs of `kind`, and runs any that were waiting for one."""
+        self._handlers[kind] = handler
+        for job in self._orphans.pop(kind, []):
+            if not job.cancelled:
+                self._push(job)
+
+    def unregister(self, kind: str):
+        self._handlers.pop(kind, None)
+
+    async def load(self):
+        """Reloads the persistent jobs saved by a previous run."""
+        saved = await self.config.scheduled() or {}
+        for job_id, data in saved.items():
+            if job_id in self._persistent:
+                continue
+            job = ScheduledJob(self, data['when'], None, (), data['kind'], data.get('payload', {}), job_id)
+            self._persistent[job_id] = job
+            self._push(job)
+
+    def _save_later(self):
+        # Coalesce the saves caused by a burst of changes into one write.
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = tracing.detached(asyncio.ensure_future, self._save())
+
+    async def _save(self):
+        # Changes made while a write is in progress are saved by another round.
+        while self._dirty:
+            await asyncio.sleep(0)
+            self._dirty = False
+            await self.config.scheduled.set({
+                job.id: {'kind': job.kind, 'when': job.when, 'payload': job.payload}
+                for job in self._persistent.values()
+            })
+
+    async def _run(self):
+        while True:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+                self._cancelled -= 1
+            self._changed.clear()
+            if not self._heap:
+                await self._changed.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, job = heapq.heappop(self._heap)
+            self._size.set(len(self))
+            metrics.timer('scheduler_lateness_seconds').observe(max(0.0, time.time() - job.when))
+            self._fire(job)
+
+    def _fire(self, job: ScheduledJob):
+        if job.persistent:
+            handler = self._handlers.get(job.kind)
+            if handler is None:
+                self._orphans.setdefault(job.kind, []).append(job)
+                return
+            del self._persistent[job.id]
+            self._save_later()
+            callback, args = handler, (job,)
+        else:
+            callback, args = job.callback, job.args
+        job.cancelled = True
+        try:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result).add_done_callback(self._log_failure)
+        except Exception:
+            log.exception(f'Scheduled job {job!r} failed.')
+
+    @staticmethod
+    def _log_failure(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            log.error('Scheduled job failed.', exc_info=task.exception())
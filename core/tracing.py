@@ -0,0 +1,185 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+import itertools
+import json
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+__all__ = [
+    'Span',
+    'Trace',
+    'Tracer',
+    'tracer',
+    'trace',
+    'span',
+    'start_span',
+    'current_trace',
+    'detached',
+]
+
+T = TypeVar('T')
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar('current_trace', default=None)
+_trace_ids = itertools.count(1)
+
+
+class Span:
+    __slots__ = ('name', 'category', 'args', 'start', 'end')
+
+    def __init__(self, name: str, category: str, args: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = time.perf_counter_ns()
+        self.end: Optional[int] = None
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter_ns()
+
+
+class Trace:
+    """All spans recorded while handling one message.
+
+    Spans started after the trace finished, or past the first :attr:`max_spans`, are not recorded.
+    """
+
+    max_spans = 1000
+
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.id = next(_trace_ids)
+        self.root = Span(name, 'trace', args)
+        self.spans: List[Span] = [self.root]
+        self.discarded = False
+        self.dropped = 0
+
+    @property
+    def name(self) -> str:
+        return self.root.name
+
+    @name.setter
+    def name(self, value: str):
+        self.root.name = value
+
+    @property
+    def duration(self) -> float:
+        end = self.root.end if self.root.end is not None else time.perf_counter_ns()
+        return (end - self.root.start) / 1e9
+
+    def discard(self):
+        """Prevents this trace from being recorded once it finishes."""
+        self.discarded = True
+
+    def start_span(self, name: str, category: str, args: Dict[str, Any]) -> Optional[Span]:
+        if self.root.end is not None or len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return None
+        new = Span(name, category, args)
+        self.spans.append(new)
+        return new
+
+
+class Tracer:
+    """Keeps the most recently finished traces in a bounded ring."""
+
+    def __init__(self, capacity: int = 256):
+        self._traces: Deque[Trace] = deque(maxlen=capacity)
+
+    def record(self, finished: Trace):
+        self._traces.append(finished)
+
+    def recent(self, count: int = None) -> List[Trace]:
+        traces = list(self._traces)
+        return traces if count is None else traces[-count:]
+
+    def clear(self):
+        self._traces.clear()
+
+    @staticmethod
+    def to_chrome(traces: Iterable[Trace]) -> str:
+        """Renders traces in Chrome's trace event format (chrome://tracing, Perfetto, speedscope).
+
+        Each trace gets its own row; spans nest by time within it.
+        """
+        events = []
+        origin = None
+        for recorded in traces:
+            if origin is None:
+                origin = recorded.root.start
+            dropped = f' ({recorded.dropped} spans dropped)' if recorded.dropped else ''
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': recorded.id,
+                           'args': {'name': f'#{recorded.id} {recorded.name}{dropped}'}})
+            for s in recorded.spans:
+                end = s.end if s.end is not None else recorded.root.end or s.start
+                events.append({
+                    'name': s.name,
+                    'cat': s.category,
+                    'ph': 'X',
+                    'ts': (s.start - origin) / 1000,
+                    'dur': max(0, end - s.start) / 1000,
+                    'pid': 1,
+                    'tid': recorded.id,
+                    'args': {k: str(v) for k, v in s.args.items()},
+                })
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+
+tracer = Tracer()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def detached(function: Callable[..., T], *args) -> T:
+    """Calls `function` in a copy of the current context where nothing is being traced.
+
+    Tasks keep the context they were created in, so one started while handling a message would
+    otherwise add its spans to that message's trace for as long as it runs. Start long-lived
+    tasks with ``detached(asyncio.ensure_future, coro)``.
+    """
+    context = copy_context()
+    context.run(_current_trace.set, None)
+    return context.run(function, *args)
+
+
+@contextmanager
+def trace(name: str, **args) -> Iterator[Trace]:
+    """Starts a new trace for the current context and records it in :data:`tracer` when done."""
+    new = Trace(name, args)
+    token = _current_trace.set(new)
+    try:
+        yield new
+    finally:
+        _current_trace.reset(token)
+        new.root.finish()
+        if not new.discarded:
+            tracer.record(new)
+
+
+def start_span(name: str, category: str = 'patbot', **args) -> Optional[Span]:
+    """Starts a span in the current trace that the caller must :meth:`~Span.finish` itself.
+
+    Returns None when nothing is being traced, or the trace does not take more spans.
+    """
+    current = _current_trace.get()
+    if current is None:
+        return None
+    return current.start_span(name, category, args)
+
+
+@contextmanager
+def span(name: str, category: str = 'patbot', **args) -> Iterator[Optional[Span]]:
+    current = _current_trace.get()
+    if current is None:
+        yield None
+        return
+    new = current.start_span(name, category, args)
+    if new is None:
+        yield None
+        return
+    try:
+        yield new
+    finally:
+        new.finish()
@@ -0,0 +1,12 @@
+import json
+from pathlib import Path
+import tempfile
+
+from core.config import Config
+
+# Some modules get their Config when they are imported, so the config files have to exist by then.
+_cogs_root = Path(tempfile.mkdtemp(prefix='patbot-tests-'))
+for cog_name in ('settings', 'dnd'):
+    (_cogs_root / cog_name).mkdir()
+    (_cogs_root / cog_name / 'config.json').write_text(json.dumps({'GLOBAL': {}, 'GUILD': {}}))
+Config._cogs_root_path = str(_cogs_root)
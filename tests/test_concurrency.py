@@ -0,0 +1,67 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from discord.ext import commands
+import pytest
+
+from core import concurrency, errors
+from core.config import Config
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    (tmp_path / 'test_concurrency').mkdir()
+    (tmp_path / 'test_concurrency' / 'config.json').write_text(json.dumps({'GLOBAL': {}, 'GUILD': {}}))
+    monkeypatch.setattr(Config, '_cogs_root_path', str(tmp_path))
+    monkeypatch.delitem(Config._config_cache, 'test_concurrency', raising=False)
+    yield Config('test_concurrency')
+    Config._config_cache.pop('test_concurrency', None)
+
+
+async def roll(ctx):
+    pass
+
+
+concurrency.limit(1, queue=0)(roll)
+
+
+class FakeCommand:
+    callback = staticmethod(roll)
+    qualified_name = 'roll'
+
+
+def make_ctx(guild=None):
+    command = FakeCommand()
+    return SimpleNamespace(guild=guild, cog=None, command=command, author=SimpleNamespace(id=1),
+                           channel=SimpleNamespace(id=2))
+
+
+def test_dm_invocation_uses_the_declared_limit(config):
+    manager = concurrency.ConcurrencyManager(config)
+
+    async def run():
+        first, second = make_ctx(), make_ctx()
+        await manager.acquire(first)
+        with pytest.raises(errors.CommandBusy):
+            await manager.acquire(second)
+        manager.release(first)
+        await manager.acquire(second)
+        manager.release(second)
+
+    asyncio.run(run())
+
+
+def test_dm_invocation_uses_a_global_override(config):
+    manager = concurrency.ConcurrencyManager(config)
+    config._data['GLOBAL']['concurrency'] = {'roll': {'limit': 2}}
+
+    async def run():
+        ctxs = [make_ctx(), make_ctx()]
+        for ctx in ctxs:
+            await manager.acquire(ctx)
+        assert manager.status()['roll']['active'] == 2
+        for ctx in ctxs:
+            manager.release(ctx)
+
+    asyncio.run(run())
@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.context import Context
+from core.outbound import OutboundScheduler
+
+
+class FakeMessage:
+    id = 1
+
+    def __init__(self):
+        self.reactions = []
+
+    async def add_reaction(self, reaction):
+        self.reactions.append(reaction)
+
+
+def make_ctx(outbound, *, add_reactions=True):
+    ctx = Context.__new__(Context)
+    ctx.bot = SimpleNamespace(outbound=outbound)
+    ctx.message = FakeMessage()
+    permissions = SimpleNamespace(add_reactions=add_reactions, read_message_history=True)
+    ctx.guild = SimpleNamespace(me=None)
+    ctx.channel = SimpleNamespace(permissions_for=lambda member: permissions)
+    ctx.sent = []
+
+    async def send(*args, **kwargs):
+        ctx.sent.append(args)
+
+    ctx.send = send
+    return ctx
+
+
+def test_react_does_not_wait_for_deferred_reactions():
+    async def run():
+        outbound = OutboundScheduler(max_defer=60)
+        ctx = make_ctx(outbound)
+        async with outbound.reply():
+            assert await asyncio.wait_for(ctx.react('\N{WHITE HEAVY CHECK MARK}'), timeout=1)
+            await asyncio.sleep(0)
+            assert ctx.message.reactions == []
+        await asyncio.sleep(0.01)
+        assert ctx.message.reactions == ['\N{WHITE HEAVY CHECK MARK}']
+        outbound.close()
+
+    asyncio.run(run())
+
+
+def test_dropped_reactions_are_not_sent_instead():
+    async def run():
+        outbound = OutboundScheduler(max_queued=0)
+        ctx = make_ctx(outbound)
+        await ctx.react_or_send('\N{WHITE HEAVY CHECK MARK}', 'Done.')
+        await asyncio.sleep(0.01)
+        assert ctx.message.reactions == []
+        assert ctx.sent == []
+        outbound.close()
+
+    asyncio.run(run())
+
+
+def test_react_or_send_sends_where_it_cannot_react():
+    async def run():
+        outbound = OutboundScheduler()
+        ctx = make_ctx(outbound, add_reactions=False)
+        await ctx.react_or_send('\N{WHITE HEAVY CHECK MARK}', 'Done.')
+        assert ctx.sent == [('\N{WHITE HEAVY CHECK MARK}', 'Done.')]
+        outbound.close()
+
+    asyncio.run(run())
@@ -0,0 +1,79 @@
+import asyncio
+
+from discord.ext import commands
+
+from cogs.dnd.cog import DnD
+from cogs.dnd.lib.dnd import EntryStore
+from cogs.dnd.lib.dnd.display import Rendered
+
+
+async def _with_cog(check):
+    bot = commands.Bot(command_prefix='!', loop=asyncio.get_running_loop())
+    bot.add_cog(DnD(bot))
+    # Nothing here should load the data, so the warm-up the cog starts is cancelled straight away.
+    for task in asyncio.all_tasks():
+        if task is not asyncio.current_task():
+            task.cancel()
+    try:
+        return await check(bot)
+    finally:
+        bot.remove_cog('DnD')
+
+
+def test_dndcache_is_registered():
+    async def check(bot):
+        command = bot.get_command('dndcache')
+        assert command is not None
+        assert command.cog is bot.get_cog('DnD')
+        assert command.hidden
+
+    asyncio.run(_with_cog(check))
+
+
+class FakeContext:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, *args, **kwargs):
+        self.sent.append(kwargs.get('content', args[-1] if args else None))
+
+
+async def _dndcache_output(bot) -> str:
+    ctx = FakeContext()
+    await bot.get_command('dndcache').callback(bot.get_cog('DnD'), ctx)
+    assert len(ctx.sent) == 1
+    return ctx.sent[0]
+
+
+def test_dndcache_reports_lookups():
+    async def check(bot):
+        cache = bot.get_cog('DnD').cache
+        cache._use({'spell': EntryStore.from_entries([
+            ('fireball', {'name': 'Fireball'}),
+            ("tasha's hideous laughter", {'name': "Tasha's Hideous Laughter"}),
+        ])})
+        assert cache.get_spell_fuzzy('Fireball') == ['fireball']
+        assert cache.get_spell_fuzzy('tashas hideous laughter') == ["tasha's hideous laughter"]
+        cache.get_spell_fuzzy('firebal')
+        cache.get_spell_fuzzy('laughter')
+        output = await _dndcache_output(bot)
+        assert '4 lookups: 1 exact, 1 by alias, 2 fuzzy (50% without fuzzy search)' in output
+
+    asyncio.run(_with_cog(check))
+
+
+def test_dndcache_reports_rendered_entries():
+    async def check(bot):
+        cog = bot.get_cog('DnD')
+        rendered = Rendered(None, ['**Fireball**'])
+
+        async def render():
+            return rendered
+
+        await cog._rendered.get_or_create(('spell', 'fireball', 'message'), render)
+        await cog._rendered.get_or_create(('spell', 'fireball', 'message'), render)
+        await cog._rendered.get_or_create(('spell', 'fireball', 'message'), render)
+        output = await _dndcache_output(bot)
+        assert f'1 rendered entries ({rendered.size} chars): 2 hits, 1 misses, 0 evicted (67% hit rate)' in output
+
+    asyncio.run(_with_cog(check))
@@ -0,0 +1,184 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+
+import aiohttp
+from aiohttp import web
+import pytest
+
+from cogs.dnd.lib.dnd import Fetcher
+from cogs.dnd.lib.dnd.cache import Cache
+from cogs.dnd.lib.dnd.data import DiskCache
+
+FILES = {
+    'spells/index.json': {'PHB': 'spells-phb.json', 'UAFoo': 'spells-uafoo.json'},
+    'spells/spells-phb.json': {'spell': [{'name': 'Fireball'}, {'name': 'Shield'}]},
+    'conditionsdiseases.json': {'condition': [{'name': 'Blinded'}]},
+}
+
+
+class FakeServer:
+    """Serves `files` under /data/ with ETags, answering conditional requests with a 304 when they match."""
+
+    def __init__(self, files):
+        self.files = dict(files)
+        self.statuses = []
+        self._runner = None
+        self.port = None
+
+    async def _handle(self, request):
+        path = request.match_info['path']
+        if path not in self.files:
+            return web.Response(status=404)
+        body = json.dumps(self.files[path]).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        status = 304 if request.headers.get('If-None-Match') == etag else 200
+        self.statuses.append((path, status))
+        if status == 304:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.port}/data/{path}'
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/data/{path:.*}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', self.port or 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+@contextlib.asynccontextmanager
+async def serving(files=FILES):
+    server = FakeServer(files)
+    await server.start()
+    try:
+        yield server
+    finally:
+        await server.stop()
+
+
+async def fetch(server, disk, path):
+    async with aiohttp.ClientSession() as session:
+        fetcher = Fetcher(session, disk=disk, retries=1, backoff=0)
+        return await fetcher.get_json(server.url(path)), fetcher
+
+
+def test_first_fetch_stores_the_file(tmp_path):
+    async def run():
+        async with serving() as server:
+            disk = DiskCache(tmp_path)
+            data, fetcher = await fetch(server, disk, 'conditionsdiseases.json')
+        url = server.url('conditionsdiseases.json')
+        assert data == FILES['conditionsdiseases.json']
+        assert server.statuses == [('conditionsdiseases.json', 200)]
+        assert fetcher.changed == {url}
+        assert await disk.load(url) == data
+        assert 'If-None-Match' in DiskCache(tmp_path).validators(url)
+
+    asyncio.run(run())
+
+
+def test_unchanged_file_is_served_from_disk(tmp_path):
+    async def run():
+        async with serving() as server:
+            disk = DiskCache(tmp_path)
+            await fetch(server, disk, 'conditionsdiseases.json')
+            data, fetcher = await fetch(server, DiskCache(tmp_path), 'conditionsdiseases.json')
+        assert data == FILES['conditionsdiseases.json']
+        assert server.statuses[-1] == ('conditionsdiseases.json', 304)
+        assert fetcher.not_modified == {server.url('conditionsdiseases.json')}
+        assert not fetcher.changed
+
+    asyncio.run(run())
+
+
+def test_disk_copy_is_used_when_the_server_is_down(tmp_path):
+    async def run():
+        async with serving() as server:
+            await fetch(server, DiskCache(tmp_path), 'conditionsdiseases.json')
+        data, fetcher = await fetch(server, DiskCache(tmp_path), 'conditionsdiseases.json')
+        assert data == FILES['conditionsdiseases.json']
+        assert not fetcher.changed and not fetcher.not_modified
+
+        with pytest.raises(aiohttp.ClientError):
+            await fetch(server, DiskCache(tmp_path), 'spells/index.json')
+
+    asyncio.run(run())
+
+
+def make_cache(server, tmp_path, **kwargs):
+    cache = Cache(cache_dir=tmp_path, **kwargs)
+    cache._sources = {
+        'spell': server.url('spells/index.json'),
+        'condition': server.url('conditionsdiseases.json'),
+    }
+    return cache
+
+
+def test_revalidating_unchanged_files_does_not_read_them(tmp_path, monkeypatch):
+    async def run():
+        async with serving() as server:
+            cache = make_cache(server, tmp_path, packed=False)
+            await cache.initialize()
+            data = cache.data
+
+            async def load(*args, **kwargs):
+                raise AssertionError('revalidating read the files')
+
+            monkeypatch.setattr(cache, '_load', load)
+            assert not await cache.revalidate()
+        assert cache.data is data
+        assert {status for _, status in server.statuses[-3:]} == {304}
+
+    asyncio.run(run())
+
+
+def test_revalidating_rebuilds_only_the_categories_that_changed(tmp_path):
+    async def run():
+        async with serving() as server:
+            cache = make_cache(server, tmp_path, packed=False)
+            await cache.initialize()
+            spells = cache.spell_cache
+            reloads = []
+            cache.add_reload_listener(lambda: reloads.append(True))
+
+            server.files['conditionsdiseases.json'] = {'condition': [{'name': 'Blinded'}, {'name': 'Charmed'}]}
+            assert await cache.revalidate()
+        assert cache.spell_cache is spells
+        assert set(cache.condition_cache) == {'blinded', 'charmed'}
+        assert cache.get_condition_fuzzy('charmed') == ['charmed']
+        assert reloads == [True]
+
+    asyncio.run(run())
+
+
+def test_unchanged_boot_maps_the_pack_without_loading_the_files(tmp_path, monkeypatch):
+    async def run():
+        async with serving() as server:
+            await make_cache(server, tmp_path).initialize()
+            pack_written = (tmp_path / 'index.pack').stat().st_mtime_ns
+
+            cache = make_cache(server, tmp_path)
+            loads = []
+
+            async def load(*args, **kwargs):
+                loads.append(args)
+                raise AssertionError('an unchanged boot read the files')
+
+            monkeypatch.setattr(cache, '_load', load)
+            await cache.initialize()
+            assert cache.loaded_from == 'pack'
+            assert not await cache._revalidating
+        assert loads == []
+        assert (tmp_path / 'index.pack').stat().st_mtime_ns == pack_written
+        assert cache.get_spell('fireball') == {'name': 'Fireball'}
+
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+from discord.ext import commands
+import pytest
+
+from cogs.polling.cog import Polling
+from cogs.polling.core.tally import SingleChoiceTally
+from core import formatting as fmt
+from core.bot import Patbot
+
+
+def test_up_to_nine_options_use_keycaps():
+    options = Polling._map_emojis(['a', 'b', 'c'])
+    assert list(options) == ['1\N{COMBINING ENCLOSING KEYCAP}', '2\N{COMBINING ENCLOSING KEYCAP}',
+                             '3\N{COMBINING ENCLOSING KEYCAP}']
+
+
+def test_ten_to_twenty_options_use_regional_indicators():
+    names = [f'option {i}' for i in range(20)]
+    options = Polling._map_emojis(names)
+    assert list(options) == [chr(0x1F1E6 + i) for i in range(20)]
+    assert list(options)[0] == '\N{REGIONAL INDICATOR SYMBOL LETTER A}'
+    assert list(options)[-1] == '\N{REGIONAL INDICATOR SYMBOL LETTER T}'
+    assert list(options.values()) == names
+
+
+def test_more_than_twenty_options_is_a_user_error():
+    with pytest.raises(commands.BadArgument, match='at most 20'):
+        Polling._map_emojis([f'option {i}' for i in range(21)])
+
+
+def test_more_than_twenty_options_is_not_reported_as_fatal():
+    sent = []
+
+    async def send(*args, **kwargs):
+        sent.append(args)
+
+    ctx = SimpleNamespace(send=send)
+    try:
+        Polling._map_emojis([f'option {i}' for i in range(21)])
+    except commands.BadArgument as e:
+        exception = commands.CommandInvokeError(e)
+    asyncio.run(Patbot.on_command_error(None, ctx, exception))
+    assert sent == [(fmt.error, 'A poll can have at most 20 options.')]
+
+
+def test_voters_are_stored_as_option_indexes():
+    tally = SingleChoiceTally(20)
+    tally.add(123456789012345678, 19)
+    tally.add(123456789012345678, 3)
+    assert tally.to_state() == {123456789012345678: 3}
+    assert list(tally.counts)[3] == 1 and list(tally.counts)[19] == 0
+    restored = SingleChoiceTally(20)
+    restored.load({'123456789012345678': 3})
+    assert restored.voters == {123456789012345678: 3}
+
+
+def test_known_modes_are_accepted():
+    assert Polling._convert_poll_args(None, [('m', 'Ranked')]) == {'mode': 'ranked'}
+
+
+def test_unknown_mode_is_rejected_with_the_valid_modes():
+    with pytest.raises(commands.BadArgument, match='single, approval, ranked'):
+        Polling._convert_poll_args(None, [('mode', 'aproval')])
+
+
+@pytest.mark.parametrize('args', [
+    [('static', True), ('anon', True)],
+    [('s', True), ('mode', 'approval')],
+    [('static', True), ('m', 'ranked')],
+])
+def test_static_polls_reject_anon_and_modes(args):
+    polling = SimpleNamespace(_convert_poll_args=Polling._convert_poll_args, _map_emojis=Polling._map_emojis)
+    with pytest.raises(commands.BadArgument, match='static poll'):
+        asyncio.run(Polling._poll.callback(polling, None, args, 'Title', 'Yes', 'No'))
@@ -0,0 +1,40 @@
+import asyncio
+
+from core import tracing
+
+
+def test_spans_after_the_trace_finished_are_not_recorded():
+    with tracing.trace('message') as trace:
+        pass
+    trace.start_span('late', 'patbot', {})
+    assert [s.name for s in trace.spans] == ['message']
+    assert trace.dropped == 1
+
+
+def test_spans_past_the_limit_are_not_recorded(monkeypatch):
+    monkeypatch.setattr(tracing.Trace, 'max_spans', 3)
+    with tracing.trace('message') as trace:
+        for i in range(5):
+            with tracing.span(f'span {i}') as new:
+                pass
+        assert new is None
+    assert [s.name for s in trace.spans] == ['message', 'span 0', 'span 1']
+    assert trace.dropped == 3
+
+
+def test_detached_tasks_do_not_add_to_the_trace_they_started_in():
+    async def background(started: asyncio.Event):
+        started.set()
+        with tracing.span('background'):
+            return tracing.current_trace()
+
+    async def run():
+        started = asyncio.Event()
+        with tracing.trace('message') as trace:
+            task = tracing.detached(asyncio.ensure_future, background(started))
+            await started.wait()
+            assert tracing.current_trace() is trace
+        assert await task is None
+        assert [s.name for s in trace.spans] == ['message']
+
+    asyncio.run(run())